@@ -4,29 +4,42 @@ FastAPI server com endpoints para análise, exportação e persistência de hist
 """
 
 from fastapi import FastAPI, HTTPException, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from datetime import datetime, date
 import os
-import io
+import asyncio
 import sqlite3
 import json
+import tempfile
 from pathlib import Path
 
-from services.hours_service import process_day, time_to_decimal
+from services.hours_service import DayRecord, conformity_sweep, process_day_record, time_to_decimal
 from services.holidays_service import (
     get_holidays_for_period, 
     classify_date, 
-    generate_date_range,
-    get_states_list
+    iter_date_range,
+    get_states_list,
+    BRAZILIAN_STATES,
 )
-
-# Importação para exportação Excel
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from services.export_service import (
+    build_results_workbook,
+    build_record_workbook,
+    build_record_csv,
+    XLSX_MEDIA_TYPE,
+    CSV_MEDIA_TYPE,
+)
+from services.export_cache import ExportCache, content_hash
+from services.export_jobs import ExportJobManager, ExportQueueFullError
+from services.redmine_service import RedmineClient, RedmineError, reconcile
+from services.history_cache import HistoryCache, listing_key, month_bounds
+from services.partitions import HistoryPartitions, PartitionFrozenError, year_of
+from services.maintenance import ActivityMiddleware, MaintenanceScheduler
+from services.single_flight import SingleFlight
 
 app = FastAPI(
     title="Sistema de Apontamento de Horas",
@@ -45,21 +58,84 @@ app.add_middleware(
 
 # ============ BANCO DE DADOS ============
 
-# O arquivo .db fica na mesma pasta do backend
-DB_PATH = Path(__file__).parent / "apontamentos.db"
+# O arquivo .db fica na mesma pasta do backend (pode ser sobrescrito por variável de ambiente,
+# usado pelos scripts de carga para não tocar no banco real)
+DB_PATH = Path(os.environ.get("APONTAMENTOS_DB_PATH", Path(__file__).parent / "apontamentos.db"))
+
+
+# Histórico particionado por ano em arquivos anexados ao banco principal (ver services/partitions.py)
+history_partitions = HistoryPartitions(DB_PATH)
 
 
 def get_db():
     """Retorna uma conexão com o banco SQLite."""
-    conn = sqlite3.connect(str(DB_PATH))
+    # uri=True: partições congeladas são anexadas com file:...?mode=ro / ?immutable=1
+    conn = sqlite3.connect(str(DB_PATH), uri=True)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# Formato das colunas *_iso (yyyy-mm-dd), para o GLOB do SQLite
+ISO_DATE_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]"
+
+
+def date_to_iso(date_str: str) -> Optional[str]:
+    """Converte dd/mm/yyyy para yyyy-mm-dd (ordenável e indexável). Retorna None se inválida."""
+    try:
+        return datetime.strptime(date_str, "%d/%m/%Y").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+
+def row_to_record(row: sqlite3.Row) -> Dict:
+    """Converte uma linha completa de `apontamentos` no formato de detalhe da API."""
+    return {
+        "id": row["id"],
+        "colaborador": row["colaborador"],
+        "periodo_inicio": row["periodo_inicio"],
+        "periodo_fim": row["periodo_fim"],
+        "total_horas": row["total_horas"],
+        "criado_em": row["criado_em"],
+        "dias": json.loads(row["dados_json"]),
+    }
+
+
+# Alterações mantidas no log. Um cursor mais atrasado que isso já recebe a lista completa
+# (MAX_DELTA_CHANGES), então o restante é podado a cada gravação
+CHANGE_LOG_KEEP = 1000
+
+
+def log_change(conn: sqlite3.Connection, record_id: int, operacao: str) -> int:
+    """
+    Registra uma inclusão ("insert") ou exclusão ("delete") no log de alterações e poda
+    as entradas que passaram de CHANGE_LOG_KEEP. Retorna a sequência.
+    """
+    seq = conn.execute(
+        "INSERT INTO apontamentos_alteracoes (apontamento_id, operacao, alterado_em) VALUES (?, ?, ?)",
+        (record_id, operacao, datetime.now().isoformat(timespec="seconds")),
+    ).lastrowid
+    conn.execute("DELETE FROM apontamentos_alteracoes WHERE seq <= ?", (seq - CHANGE_LOG_KEEP,))
+    return seq
+
+
+def current_change_seq(conn: sqlite3.Connection) -> int:
+    """Última sequência do log de alterações (cursor de sincronismo)."""
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM apontamentos_alteracoes").fetchone()[0]
+
+
+def oldest_change_cursor(conn: sqlite3.Connection) -> int:
+    """Menor cursor ainda atendido por delta: as alterações até ele podem ter sido podadas do log."""
+    return conn.execute("SELECT COALESCE(MIN(seq), 1) - 1 FROM apontamentos_alteracoes").fetchone()[0]
+
+
 def init_db():
-    """Inicializa o banco de dados criando a tabela se não existir."""
+    """Inicializa o banco de dados criando a tabela e os índices se não existirem."""
     conn = get_db()
     try:
+        # WAL: leituras não bloqueiam gravações (e a manutenção faz checkpoints periódicos);
+        # auto_vacuum incremental só tem efeito em bancos novos, antes da primeira tabela
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.execute("""
             CREATE TABLE IF NOT EXISTS apontamentos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,17 +144,140 @@ def init_db():
                 periodo_fim TEXT NOT NULL,
                 total_horas REAL DEFAULT 0,
                 criado_em TEXT NOT NULL,
-                dados_json TEXT NOT NULL
+                dados_json TEXT NOT NULL,
+                periodo_inicio_iso TEXT,
+                periodo_fim_iso TEXT
+            )
+        """)
+
+        # Migração de bancos antigos: colunas ISO (yyyy-mm-dd) permitem filtrar período por índice
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(apontamentos)")}
+        if "periodo_inicio_iso" not in columns:
+            conn.execute("ALTER TABLE apontamentos ADD COLUMN periodo_inicio_iso TEXT")
+            conn.execute("ALTER TABLE apontamentos ADD COLUMN periodo_fim_iso TEXT")
+        # Preenche com a mesma conversão das gravações ("1/2/2024" também é aceito); também
+        # corrige valores inválidos deixados por versões que recortavam a string sem padding
+        conn.create_function("date_to_iso", 1, date_to_iso, deterministic=True)
+        conn.execute("""
+            UPDATE apontamentos SET
+                periodo_inicio_iso = date_to_iso(periodo_inicio),
+                periodo_fim_iso = date_to_iso(periodo_fim)
+            WHERE periodo_inicio_iso IS NULL OR periodo_inicio_iso NOT GLOB ?
+               OR periodo_fim_iso IS NULL OR periodo_fim_iso NOT GLOB ?
+        """, (ISO_DATE_GLOB, ISO_DATE_GLOB))
+
+        # Log de alterações (inclusões e exclusões) com sequência monotônica, usado pelo
+        # sincronismo incremental do histórico (/api/historico?since=<cursor>)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS apontamentos_alteracoes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                apontamento_id INTEGER NOT NULL,
+                operacao TEXT NOT NULL,
+                alterado_em TEXT NOT NULL
             )
         """)
+
+        # Índices usados por verificar-duplicata (LOWER(colaborador)) e pelo filtro de mês
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_colaborador ON apontamentos(LOWER(colaborador))")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_inicio ON apontamentos(periodo_inicio_iso)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_fim ON apontamentos(periodo_fim_iso)")
         conn.commit()
+
+        # Catálogo das partições anuais; registros com data ainda na tabela principal são movidos
+        history_partitions.init(conn)
+        # Gravações pela metade de uma queda durante o commit (WAL não é atômico entre arquivos)
+        history_partitions.reconcile(conn, lambda c, record_id: log_change(c, record_id, "delete"))
     finally:
         conn.close()
 
 
+# Cache em memória das consultas de histórico (ver services/history_cache.py)
+history_cache = HistoryCache(
+    connect=lambda: sqlite3.connect(str(DB_PATH), uri=True, check_same_thread=False),
+    describe=history_partitions.describe,
+    max_listings=int(os.environ.get("HISTORY_CACHE_MAX_LISTINGS", "256")),
+    max_details=int(os.environ.get("HISTORY_CACHE_MAX_DETAILS", "1024")),
+)
+
+
+# ============ JOBS DE EXPORTAÇÃO ============
+
+# Planilhas grandes são geradas em processos separados para não travar o event loop
+export_jobs = ExportJobManager(
+    output_dir=Path(tempfile.gettempdir()) / "apontamentos_exportacoes",
+    max_workers=int(os.environ.get("EXPORT_MAX_WORKERS", "2")),
+    max_pending=int(os.environ.get("EXPORT_MAX_PENDING", "8")),
+    ttl_seconds=int(os.environ.get("EXPORT_JOB_TTL", "900")),
+)
+EXPORT_CLEANUP_INTERVAL = 60  # segundos
+
+# Registros salvos não mudam: o arquivo exportado de cada um é gerado uma vez e servido do disco
+export_cache = ExportCache(
+    cache_dir=Path(os.environ.get("EXPORT_CACHE_DIR", DB_PATH.parent / "cache_exportacoes")),
+    max_bytes=int(os.environ.get("EXPORT_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+
+# Manutenção do SQLite em segundo plano (ver services/maintenance.py); timeout=0: nunca espera por locks
+maintenance = MaintenanceScheduler(
+    connect=lambda: sqlite3.connect(str(DB_PATH), uri=True, timeout=0, isolation_level=None, check_same_thread=False),
+    partitions=history_partitions,
+    budget_ms=float(os.environ.get("MAINTENANCE_BUDGET_MS", "5")),
+    check_budget_ms=float(os.environ.get("MAINTENANCE_CHECK_BUDGET_MS", "250")),
+    idle_seconds=float(os.environ.get("MAINTENANCE_IDLE_SECONDS", "2")),
+    tick_seconds=float(os.environ.get("MAINTENANCE_TICK_SECONDS", "5")),
+)
+MAINTENANCE_ENABLED = os.environ.get("MAINTENANCE_ENABLED", "1") != "0"
+
+# Acompanha o tráfego para a manutenção rodar nas janelas ociosas (até o fim do corpo da resposta)
+app.add_middleware(ActivityMiddleware, scheduler=maintenance)
+
+
+async def cleanup_export_jobs_loop():
+    """Remove periodicamente os jobs de exportação expirados."""
+    while True:
+        await asyncio.sleep(EXPORT_CLEANUP_INTERVAL)
+        export_jobs.cleanup_expired()
+
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    app.state.export_cleanup_task = asyncio.create_task(cleanup_export_jobs_loop())
+    app.state.maintenance_task = (
+        asyncio.create_task(maintenance.run_forever()) if MAINTENANCE_ENABLED else None
+    )
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.export_cleanup_task.cancel()
+    if app.state.maintenance_task is not None:
+        app.state.maintenance_task.cancel()
+    maintenance.close()
+    export_jobs.shutdown()
+    history_cache.close()
+    if redmine_client is not None:
+        await redmine_client.close()
+
+
+# ============ REDMINE ============
+
+# Cliente único por processo, para reaproveitar as conexões keep-alive entre requisições
+redmine_client: Optional[RedmineClient] = None
+
+
+def get_redmine_client() -> Optional[RedmineClient]:
+    """Retorna o cliente do Redmine (criado sob demanda) ou None se REDMINE_URL não estiver configurada."""
+    global redmine_client
+    if redmine_client is None and os.environ.get("REDMINE_URL"):
+        redmine_client = RedmineClient(
+            base_url=os.environ["REDMINE_URL"],
+            api_key=os.environ.get("REDMINE_API_KEY", ""),
+            max_connections=int(os.environ.get("REDMINE_MAX_CONNECTIONS", "10")),
+            max_concurrency=int(os.environ.get("REDMINE_MAX_CONCURRENCY", "4")),
+        )
+    return redmine_client
 
 
 # ============ MODELOS ============
@@ -102,6 +301,11 @@ class AnalyzeRequest(BaseModel):
     manual_exceptions: Optional[List[ManualException]] = []
 
 
+class SweepRequest(AnalyzeRequest):
+    tolerances: List[int]         # tolerâncias em minutos a simular
+    expected_hours: List[float]   # jornadas (horas esperadas por dia) a simular
+
+
 class DayResult(BaseModel):
     date: str
     day_of_week: str
@@ -126,6 +330,11 @@ class ExportRequest(BaseModel):
     days: List[Dict]
 
 
+class ReconcileRequest(BaseModel):
+    user_id: int          # id do usuário no Redmine
+    days: List[Dict]      # dias retornados por /api/analyze
+
+
 class IntervalDetail(BaseModel):
     entry: str = ""
     exit: str = ""
@@ -150,6 +359,10 @@ class SaveRequest(BaseModel):
     dias: List[DayDetail]
 
 
+class SaveCheckedRequest(SaveRequest):
+    ignorar_duplicata: bool = False  # salvar mesmo havendo período sobreposto
+
+
 # ============ ENDPOINTS ============
 
 @app.get("/api/health")
@@ -157,6 +370,20 @@ async def health_check():
     """Endpoint para manter a aplicação ativa (anti-sleep)"""
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+
+@app.get("/api/metrics")
+async def metrics():
+    """Métricas internas dos caches (taxa de acerto, invalidações, tamanho), da coalescência e da manutenção do banco."""
+    return {
+        "history_cache": history_cache.stats(),
+        "export_cache": export_cache.stats(),
+        "single_flight": {
+            "holidays": holidays_flight.stats(),
+            "analyze": analysis_flight.stats(),
+        },
+        "maintenance": maintenance.stats(),
+    }
+
 # NOTA: A raiz "/" é servida automaticamente pelo StaticFiles(html=True) no final do arquivo
 
 
@@ -172,116 +399,174 @@ async def list_holidays(year: int, state: str):
     try:
         start = date(year, 1, 1)
         end = date(year, 12, 31)
-        holidays_dict = get_holidays_for_period(start, end, state)
+        holidays_dict = await get_holidays_coalesced(start, end, state)
         return {"holidays": holidays_dict}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@app.post("/api/analyze")
-async def analyze_hours(request: AnalyzeRequest):
+# ============ ANÁLISE ============
+
+# No início do mês muitos usuários pedem os mesmos feriados e análises quase idênticas ao
+# mesmo tempo: computações iguais em andamento são executadas uma vez só e compartilhadas
+holidays_flight = SingleFlight("holidays")
+analysis_flight = SingleFlight("analyze")
+
+
+async def get_holidays_coalesced(start_date: date, end_date: date, state: str) -> Dict[str, str]:
+    """get_holidays_for_period fora do event loop, coalescendo chamadas idênticas simultâneas."""
+    state = state.strip().upper()
+    key = (start_date, end_date, state if state in BRAZILIAN_STATES else "SP")
+    return await holidays_flight.do(key, run_in_threadpool, get_holidays_for_period, start_date, end_date, key[2])
+
+
+def analysis_key(request: AnalyzeRequest) -> str:
+    """Chave normalizada de um pedido de análise (campos irrelevantes não diferenciam pedidos)."""
+    payload = request.model_dump()
+    payload["state"] = payload["state"].strip().upper()
+    if payload["selection_type"] == "single":
+        payload["end_date"] = None
+    payload["manual_exceptions"] = sorted(
+        (exc["date"], exc["type"]) for exc in payload["manual_exceptions"] or []
+    )
+    return json.dumps(payload, sort_keys=True, ensure_ascii=False)
+
+
+DAYS_OF_WEEK = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+
+MANUAL_EXCEPTION_NAMES = {
+    "ferias": "Férias",
+    "afastamento": "Afastamento",
+    "atestado": "Atestado",
+    "banco": "Banco de Horas",
+    "feriado_manual": "Feriado Manual"
+}
+
+
+async def prepare_analysis(request: AnalyzeRequest):
     """
-    Analisa as horas trabalhadas para o período informado.
+    Valida o pedido de análise e carrega o que é compartilhado por todos os dias.
+    Retorna (start_date, end_date, holidays_dict, manual_exceptions).
     """
-    try:
-        # Parse das datas
-        start_date = datetime.strptime(request.start_date, "%d/%m/%Y").date()
-        
-        if request.selection_type == "single":
-            end_date = start_date
+    # Parse das datas
+    start_date = datetime.strptime(request.start_date, "%d/%m/%Y").date()
+
+    if request.selection_type == "single":
+        end_date = start_date
+    else:
+        end_date = datetime.strptime(request.end_date, "%d/%m/%Y").date()
+
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="Data final não pode ser menor que a inicial")
+
+    # Verificar quantidade de horas informadas (sem gerar a lista de datas)
+    total_days = (end_date - start_date).days + 1
+    if len(request.worked_hours) != total_days:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Esperado {total_days} valores de horas, recebido {len(request.worked_hours)}"
+        )
+
+    # Buscar feriados
+    holidays_dict = await get_holidays_coalesced(start_date, end_date, request.state)
+
+    # Converter exceções manuais para dict
+    manual_exceptions = {}
+    for exc in request.manual_exceptions or []:
+        manual_exceptions[exc.date] = MANUAL_EXCEPTION_NAMES.get(exc.type, exc.type)
+
+    return start_date, end_date, holidays_dict, manual_exceptions
+
+
+def new_analysis_stats(total_days: int) -> Dict:
+    return {
+        "total_days": total_days,
+        "workdays_analyzed": 0,
+        "days_ok": 0,
+        "days_divergent": 0,
+        "days_ignored": 0,
+        "total_worked_hours": 0.0,
+        "total_redmine_hours": 0.0,
+        "conformity_percentage": 0.0
+    }
+
+
+def iter_analysis(request: AnalyzeRequest, start_date: date, end_date: date,
+                  holidays_dict: Dict[str, str], manual_exceptions: Dict[str, str],
+                  stats: Dict) -> Iterator[DayRecord]:
+    """
+    Processa o período dia a dia (pipeline de geradores), atualizando `stats` conforme avança.
+    """
+    for date_obj, worked_time in zip(iter_date_range(start_date, end_date), request.worked_hours):
+        date_str = date_obj.strftime("%d/%m/%Y")
+
+        # Classificar o dia
+        classification = classify_date(date_str, holidays_dict, manual_exceptions)
+
+        if classification["is_workday"]:
+            # Dia útil - processar
+            day_result = process_day_record(date_str, worked_time)
+
+            stats["workdays_analyzed"] += 1
+
+            if day_result.status == "confere":
+                stats["days_ok"] += 1
+            else:
+                stats["days_divergent"] += 1
+
+            # Somar horas
+            decimal_hours = time_to_decimal(worked_time)
+            stats["total_worked_hours"] += decimal_hours
+            stats["total_redmine_hours"] += decimal_hours
+
         else:
-            end_date = datetime.strptime(request.end_date, "%d/%m/%Y").date()
-        
-        if end_date < start_date:
-            raise HTTPException(status_code=400, detail="Data final não pode ser menor que a inicial")
-        
-        # Gerar lista de datas
-        dates = generate_date_range(start_date, end_date)
-        
-        # Verificar quantidade de horas informadas
-        if len(request.worked_hours) != len(dates):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Esperado {len(dates)} valores de horas, recebido {len(request.worked_hours)}"
-            )
-        
-        # Buscar feriados
-        holidays_dict = get_holidays_for_period(start_date, end_date, request.state)
-        
-        # Converter exceções manuais para dict
-        manual_exceptions = {}
-        if request.manual_exceptions:
-            type_names = {
-                "ferias": "Férias",
-                "afastamento": "Afastamento",
-                "atestado": "Atestado",
-                "banco": "Banco de Horas",
-                "feriado_manual": "Feriado Manual"
-            }
-            for exc in request.manual_exceptions:
-                manual_exceptions[exc.date] = type_names.get(exc.type, exc.type)
-        
+            # Dia ignorado
+            day_result = process_day_record(date_str, "----", classification["description"])
+            stats["days_ignored"] += 1
+
+        day_result.day_of_week = DAYS_OF_WEEK[date_obj.weekday()]
+        yield day_result
+
+
+def finalize_analysis_stats(stats: Dict) -> Dict:
+    # Calcular percentual de conformidade
+    if stats["workdays_analyzed"] > 0:
+        stats["conformity_percentage"] = round(
+            (stats["days_ok"] / stats["workdays_analyzed"]) * 100, 2
+        )
+
+    # Formatar totais
+    stats["total_worked_display"] = f"{stats['total_worked_hours']:.2f}h"
+    stats["total_redmine_display"] = f"{stats['total_redmine_hours']:.2f}h"
+    return stats
+
+
+async def run_analysis(request: AnalyzeRequest) -> Dict:
+    """Executa a análise completa; o processamento dos dias roda no threadpool."""
+    start_date, end_date, holidays_dict, manual_exceptions = await prepare_analysis(request)
+
+    def process_days():
         # Processar cada dia
-        results = []
-        stats = {
-            "total_days": len(dates),
-            "workdays_analyzed": 0,
-            "days_ok": 0,
-            "days_divergent": 0,
-            "days_ignored": 0,
-            "total_worked_hours": 0.0,
-            "total_redmine_hours": 0.0,
-            "conformity_percentage": 0.0
-        }
-        
-        days_of_week = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
-        
-        for i, date_str in enumerate(dates):
-            date_obj = datetime.strptime(date_str, "%d/%m/%Y").date()
-            day_of_week = days_of_week[date_obj.weekday()]
-            
-            # Classificar o dia
-            classification = classify_date(date_str, holidays_dict, manual_exceptions)
-            
-            if classification["is_workday"]:
-                # Dia útil - processar
-                worked_time = request.worked_hours[i]
-                day_result = process_day(date_str, worked_time)
-                
-                stats["workdays_analyzed"] += 1
-                
-                if day_result["status"] == "confere":
-                    stats["days_ok"] += 1
-                else:
-                    stats["days_divergent"] += 1
-                
-                # Somar horas
-                decimal_hours = time_to_decimal(worked_time)
-                stats["total_worked_hours"] += decimal_hours
-                stats["total_redmine_hours"] += decimal_hours
-                
-            else:
-                # Dia ignorado
-                day_result = process_day(date_str, "----", classification["description"])
-                stats["days_ignored"] += 1
-            
-            day_result["day_of_week"] = day_of_week
-            results.append(day_result)
-        
-        # Calcular percentual de conformidade
-        if stats["workdays_analyzed"] > 0:
-            stats["conformity_percentage"] = round(
-                (stats["days_ok"] / stats["workdays_analyzed"]) * 100, 2
-            )
-        
-        # Formatar totais
-        stats["total_worked_display"] = f"{stats['total_worked_hours']:.2f}h"
-        stats["total_redmine_display"] = f"{stats['total_redmine_hours']:.2f}h"
-        
+        stats = new_analysis_stats(len(request.worked_hours))
+        results = [
+            day.to_dict()
+            for day in iter_analysis(request, start_date, end_date, holidays_dict, manual_exceptions, stats)
+        ]
         return {
             "days": results,
-            "summary": stats
+            "summary": finalize_analysis_stats(stats)
         }
+
+    return await run_in_threadpool(process_days)
+
+
+@app.post("/api/analyze")
+async def analyze_hours(request: AnalyzeRequest):
+    """
+    Analisa as horas trabalhadas para o período informado.
+    """
+    try:
+        return await analysis_flight.do(analysis_key(request), run_analysis, request)
         
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Erro ao processar datas: {str(e)}")
@@ -289,77 +574,91 @@ async def analyze_hours(request: AnalyzeRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/analyze/stream")
+async def analyze_hours_stream(request: AnalyzeRequest):
+    """
+    Mesma análise de /api/analyze, em streaming NDJSON (uma linha JSON por dia assim
+    que é calculado, e o resumo como última linha). Indicado para períodos de vários anos:
+    o primeiro byte sai logo e a memória não cresce com o tamanho do período.
+
+    Linhas: {"day": {...}} para cada dia e {"summary": {...}} ao final.
+    """
+    try:
+        start_date, end_date, holidays_dict, manual_exceptions = await prepare_analysis(request)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao processar datas: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def generate_lines():
+        stats = new_analysis_stats(len(request.worked_hours))
+        for day in iter_analysis(request, start_date, end_date, holidays_dict, manual_exceptions, stats):
+            yield json.dumps({"day": day.to_dict()}, ensure_ascii=False) + "\n"
+        yield json.dumps({"summary": finalize_analysis_stats(stats)}, ensure_ascii=False) + "\n"
+
+    # Gerador síncrono: o Starlette o consome no threadpool, fora do event loop
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+
+# Limite de valores por eixo da simulação (o custo cresce com jornadas x dias)
+MAX_SWEEP_VALUES = 50
+
+
+@app.post("/api/analyze/sweep")
+async def analyze_sweep(request: SweepRequest):
+    """
+    Simula a conformidade do período sob outras regras: para cada combinação de
+    tolerância (minutos) e jornada (horas esperadas), retorna dias que conferem,
+    dias divergentes e percentual de conformidade. Os dias úteis são classificados
+    uma única vez, como em /api/analyze; tolerância 2 e jornada 8 reproduzem o resumo dela.
+    """
+    try:
+        if not request.tolerances or not request.expected_hours:
+            raise HTTPException(status_code=400, detail="Informe ao menos uma tolerância e uma jornada")
+        if len(set(request.tolerances)) > MAX_SWEEP_VALUES or len(set(request.expected_hours)) > MAX_SWEEP_VALUES:
+            raise HTTPException(status_code=400, detail=f"Máximo de {MAX_SWEEP_VALUES} valores por eixo")
+        if any(t < 0 for t in request.tolerances) or any(not 0 < h <= 24 for h in request.expected_hours):
+            raise HTTPException(status_code=400, detail="Tolerância deve ser >= 0 e jornada entre 0 e 24 horas")
+
+        start_date, end_date, holidays_dict, manual_exceptions = await prepare_analysis(request)
+
+        def sweep():
+            stats = new_analysis_stats(len(request.worked_hours))
+            worked = [
+                time_to_decimal(day.worked_time)
+                for day in iter_analysis(request, start_date, end_date, holidays_dict, manual_exceptions, stats)
+                if not day.is_ignored
+            ]
+            return {
+                "workdays_analyzed": stats["workdays_analyzed"],
+                "days_ignored": stats["days_ignored"],
+                "grid": conformity_sweep(worked, request.expected_hours, request.tolerances),
+            }
+
+        return await run_in_threadpool(sweep)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Erro ao processar datas: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/export")
 async def export_to_excel(request: ExportRequest):
     """
     Exporta os dados para arquivo Excel.
     """
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Apontamento de Horas"
-        
-        # Estilos
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
-        header_alignment = Alignment(horizontal="center", vertical="center")
-        
-        ok_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-        divergent_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-        ignored_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-        
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-        
-        # Cabeçalhos (removido "Diferença")
-        headers = ["Data", "Dia", "Tempo Trabalhado", "Valor Redmine", "Tipo", "Status"]
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-            cell.border = thin_border
-        
-        # Dados
-        for row_idx, day in enumerate(request.days, 2):
-            ws.cell(row=row_idx, column=1, value=day.get("date", "")).border = thin_border
-            ws.cell(row=row_idx, column=2, value=day.get("day_of_week", "")).border = thin_border
-            ws.cell(row=row_idx, column=3, value=day.get("worked_time", "")).border = thin_border
-            ws.cell(row=row_idx, column=4, value=day.get("redmine_value", "")).border = thin_border
-            ws.cell(row=row_idx, column=5, value=day.get("day_type", "")).border = thin_border
-            
-            status_cell = ws.cell(row=row_idx, column=6, value=day.get("status_description", ""))
-            status_cell.border = thin_border
-            
-            # Aplicar cor baseada no status
-            status = day.get("status", "")
-            if status == "ok":
-                for col in range(1, 7):
-                    ws.cell(row=row_idx, column=col).fill = ok_fill
-            elif status == "divergent":
-                for col in range(1, 7):
-                    ws.cell(row=row_idx, column=col).fill = divergent_fill
-            elif status == "ignorado":
-                for col in range(1, 7):
-                    ws.cell(row=row_idx, column=col).fill = ignored_fill
-        
-        # Ajustar largura das colunas
-        column_widths = [12, 12, 18, 15, 20, 18]
-        for col, width in enumerate(column_widths, 1):
-            ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
-        
-        # Salvar em bytes
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
+        # Geração da planilha fora do event loop
+        content = await run_in_threadpool(build_results_workbook, request.days)
+
         return Response(
-            content=output.getvalue(),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            content=content,
+            media_type=XLSX_MEDIA_TYPE,
             headers={
                 "Content-Disposition": "attachment; filename=apontamento_resultado.xlsx"
             }
@@ -369,8 +668,191 @@ async def export_to_excel(request: ExportRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/export/jobs", status_code=202)
+async def create_export_job(request: ExportRequest):
+    """
+    Enfileira a exportação para Excel em segundo plano.
+    Retorna o id do job; acompanhe em /api/export/jobs/{job_id} e baixe em .../download.
+    """
+    try:
+        job = export_jobs.submit(
+            build_results_workbook,
+            (request.days,),
+            filename="apontamento_resultado.xlsx",
+            media_type=XLSX_MEDIA_TYPE,
+        )
+    except ExportQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar exportação: {str(e)}")
+
+    return job
+
+
+@app.get("/api/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Retorna o status de um job de exportação (pendente, processando, concluido ou erro)."""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return export_jobs.describe(job)
+
+
+@app.get("/api/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """Baixa o arquivo gerado por um job concluído."""
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    if job["status"] == "erro":
+        raise HTTPException(status_code=500, detail=f"Erro ao exportar: {job['error']}")
+    if job["status"] != "concluido":
+        raise HTTPException(status_code=409, detail="Exportação ainda em processamento")
+
+    return FileResponse(job["path"], media_type=job["media_type"], filename=job["filename"])
+
+
+@app.post("/api/redmine/reconciliar")
+async def reconciliar_redmine(request: ReconcileRequest):
+    """
+    Compara o valor Redmine calculado de cada dia com as horas efetivamente lançadas
+    no Redmine pelo usuário no mesmo período, apontando as divergências.
+    """
+    client = get_redmine_client()
+    if client is None:
+        raise HTTPException(status_code=503, detail="Integração com o Redmine não configurada (REDMINE_URL)")
+
+    dates = [
+        datetime.strptime(day["date"], "%d/%m/%Y").date()
+        for day in request.days
+        if date_to_iso(day.get("date"))
+    ]
+    if not dates:
+        raise HTTPException(status_code=400, detail="Nenhum dia válido informado")
+
+    try:
+        entries = await client.fetch_time_entries(request.user_id, min(dates), max(dates))
+        return reconcile(request.days, entries)
+    except RedmineError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # ============ ENDPOINTS DE HISTÓRICO ============
 
+HISTORY_SUMMARY_COLUMNS = "id, colaborador, periodo_inicio, periodo_fim, total_horas, criado_em"
+
+
+def find_conflicts(conn: sqlite3.Connection, colaborador: str, inicio_iso: str, fim_iso: str,
+                   partitions: Optional[List] = None) -> List[Dict]:
+    """
+    Registros do mesmo colaborador (case-insensitive) com sobreposição de período:
+    só não há sobreposição se um termina antes do outro começar.
+    Só são consultadas as partições cujo catálogo admite sobreposição com o período.
+    """
+    if partitions is None:
+        partitions = history_partitions.overlapping(conn, inicio_iso, fim_iso)
+
+    rows = []
+    for partition in partitions:
+        schema = history_partitions.attach(conn, partition.ano)
+        rows.extend(conn.execute(
+            f"""
+            SELECT {HISTORY_SUMMARY_COLUMNS}
+            FROM {schema}.apontamentos
+            WHERE LOWER(colaborador) = LOWER(?)
+              AND periodo_inicio_iso <= ? AND periodo_fim_iso >= ?
+            """,
+            (colaborador.strip(), fim_iso, inicio_iso)
+        ).fetchall())
+    rows.sort(key=lambda row: row["id"], reverse=True)
+
+    return [
+        {
+            "id": row["id"],
+            "colaborador": row["colaborador"],
+            "periodo_inicio": row["periodo_inicio"],
+            "periodo_fim": row["periodo_fim"],
+            "total_horas": row["total_horas"],
+            "criado_em": row["criado_em"],
+        }
+        for row in rows
+    ]
+
+
+def find_conflicts_locked(conn: sqlite3.Connection, colaborador: str, inicio_iso: str, fim_iso: str) -> List[Dict]:
+    """
+    find_conflicts dentro da transação de gravação (BEGIN IMMEDIATE), onde não é possível
+    anexar partições. As já anexadas à conexão são consultadas nela; as demais, em lotes do
+    tamanho do limite de ATTACH, por uma conexão de leitura à parte. Toda gravação no
+    histórico passa pelo banco principal, cujo lock esta transação detém: nada muda até o commit.
+    """
+    candidatas = history_partitions.overlapping(conn, inicio_iso, fim_iso)
+    pendentes = set(history_partitions.unattached(conn, candidatas))
+    conflitos = find_conflicts(
+        conn, colaborador, inicio_iso, fim_iso, [p for p in candidatas if p.ano not in pendentes]
+    )
+    if not pendentes:
+        return conflitos
+
+    reader = get_db()
+    try:
+        restantes = [p for p in candidatas if p.ano in pendentes]
+        batch_size = history_partitions.attach_limit(reader)
+        for start in range(0, len(restantes), batch_size):
+            batch = restantes[start:start + batch_size]
+            for partition in batch:
+                history_partitions.attach(reader, partition.ano, partition.estado)
+            conflitos.extend(find_conflicts(reader, colaborador, inicio_iso, fim_iso, batch))
+            for partition in batch:
+                history_partitions.detach(reader, partition.ano)
+    finally:
+        reader.close()
+    conflitos.sort(key=lambda registro: registro["id"], reverse=True)
+    return conflitos
+
+
+def insert_apontamento(conn: sqlite3.Connection, request: SaveRequest):
+    """
+    Insere o apontamento na partição do ano de início e registra no log de alterações (sem commit).
+    A partição já deve ter sido preparada com history_partitions.ensure (fora da transação).
+    Retorna (id, seq, criado_em).
+    """
+    criado_em = datetime.now().strftime("%d/%m/%Y %H:%M")
+    dados_json = json.dumps(
+        [d.model_dump() for d in request.dias],
+        ensure_ascii=False
+    )
+    inicio_iso = date_to_iso(request.periodo_inicio)
+    fim_iso = date_to_iso(request.periodo_fim)
+    ano = year_of(inicio_iso)
+
+    record_id = history_partitions.allocate(conn, ano)
+    conn.execute(
+        f"""
+        INSERT INTO {history_partitions.schema(ano)}.apontamentos (id, colaborador, periodo_inicio, periodo_fim,
+                                  total_horas, criado_em, dados_json, periodo_inicio_iso, periodo_fim_iso)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            record_id,
+            request.colaborador.strip(),
+            request.periodo_inicio,
+            request.periodo_fim,
+            request.total_horas,
+            criado_em,
+            dados_json,
+            inicio_iso,
+            fim_iso,
+        )
+    )
+    history_partitions.register_insert(conn, ano, record_id, fim_iso)
+    history_partitions.register_names(conn, [request.colaborador.strip()])
+    seq = log_change(conn, record_id, "insert")
+    return record_id, seq, criado_em
+
+
 @app.get("/api/verificar-duplicata")
 async def verificar_duplicata(
     colaborador: str = Query(..., description="Nome do colaborador"),
@@ -382,53 +864,17 @@ async def verificar_duplicata(
     o período informado. Retorna os registros conflitantes caso existam.
     """
     try:
-        conn = get_db()
-        try:
-            # Busca registros do mesmo colaborador (case-insensitive)
-            rows = conn.execute(
-                """
-                SELECT id, colaborador, periodo_inicio, periodo_fim, total_horas, criado_em
-                FROM apontamentos
-                WHERE LOWER(colaborador) = LOWER(?)
-                ORDER BY id DESC
-                """,
-                (colaborador.strip(),)
-            ).fetchall()
-        finally:
-            conn.close()
-
-        if not rows:
-            return {"duplicata": False, "registros": []}
-
-        # Converter datas para comparação
-        def parse_date(d):
-            try:
-                return datetime.strptime(d, "%d/%m/%Y").date()
-            except Exception:
-                return None
-
-        novo_inicio = parse_date(periodo_inicio)
-        novo_fim = parse_date(periodo_fim)
+        novo_inicio = date_to_iso(periodo_inicio)
+        novo_fim = date_to_iso(periodo_fim)
 
         if not novo_inicio or not novo_fim:
             return {"duplicata": False, "registros": []}
 
-        conflitos = []
-        for row in rows:
-            ex_inicio = parse_date(row["periodo_inicio"])
-            ex_fim = parse_date(row["periodo_fim"])
-            if not ex_inicio or not ex_fim:
-                continue
-            # Sobreposição: não há sobreposição apenas se um termina antes do outro começar
-            if not (novo_fim < ex_inicio or novo_inicio > ex_fim):
-                conflitos.append({
-                    "id": row["id"],
-                    "colaborador": row["colaborador"],
-                    "periodo_inicio": row["periodo_inicio"],
-                    "periodo_fim": row["periodo_fim"],
-                    "total_horas": row["total_horas"],
-                    "criado_em": row["criado_em"],
-                })
+        conn = get_db()
+        try:
+            conflitos = find_conflicts(conn, colaborador, novo_inicio, novo_fim)
+        finally:
+            conn.close()
 
         return {
             "duplicata": len(conflitos) > 0,
@@ -446,33 +892,79 @@ async def salvar_apontamento(request: SaveRequest):
     Recebe: colaborador, periodo_inicio, periodo_fim, total_horas, dias (com intervalos e descrições).
     """
     try:
-        criado_em = datetime.now().strftime("%d/%m/%Y %H:%M")
-        dados_json = json.dumps(
-            [d.model_dump() for d in request.dias],
-            ensure_ascii=False
+        conn = get_db()
+        try:
+            history_partitions.ensure(conn, year_of(date_to_iso(request.periodo_inicio)))
+            record_id, seq, criado_em = insert_apontamento(conn, request)
+            conn.commit()
+        finally:
+            conn.close()
+
+        history_cache.on_insert(
+            seq, request.colaborador.strip(),
+            date_to_iso(request.periodo_inicio), date_to_iso(request.periodo_fim),
         )
 
+        return {
+            "id": record_id,
+            "mensagem": "Apontamento salvo com sucesso!",
+            "colaborador": request.colaborador,
+            "criado_em": criado_em,
+        }
+
+    except PartitionFrozenError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao salvar apontamento: {str(e)}")
+
+
+@app.post("/api/salvar-apontamento-verificado", status_code=201)
+async def salvar_apontamento_verificado(request: SaveCheckedRequest):
+    """
+    Verifica duplicata e salva em uma única transação (BEGIN IMMEDIATE): não há janela
+    entre a verificação e a gravação, então dois salvamentos simultâneos não duplicam.
+
+    Sem conflito (ou com ignorar_duplicata=true): 201 com o id salvo.
+    Com conflito: 409 com {"duplicata": true, "registros": [...]} e nada é gravado.
+    """
+    try:
+        inicio_iso = date_to_iso(request.periodo_inicio)
+        fim_iso = date_to_iso(request.periodo_fim)
+
+        verificar = bool(inicio_iso and fim_iso and not request.ignorar_duplicata)
+
         conn = get_db()
+        # Transação controlada manualmente: o lock de escrita é adquirido já na verificação
+        conn.isolation_level = None
         try:
-            cursor = conn.execute(
-                """
-                INSERT INTO apontamentos (colaborador, periodo_inicio, periodo_fim, total_horas, criado_em, dados_json)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    request.colaborador.strip(),
-                    request.periodo_inicio,
-                    request.periodo_fim,
-                    request.total_horas,
-                    criado_em,
-                    dados_json,
-                )
-            )
-            conn.commit()
-            record_id = cursor.lastrowid
+            # ATTACH não é permitido dentro da transação: a partição de destino é anexada
+            # antes e, no espaço que sobrar, as que podem ter conflito (sem desanexar a de destino)
+            history_partitions.ensure(conn, year_of(inicio_iso))
+            if verificar:
+                history_partitions.attach_free(conn, history_partitions.overlapping(conn, inicio_iso, fim_iso))
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conflitos = []
+                if verificar:
+                    conflitos = find_conflicts_locked(conn, request.colaborador, inicio_iso, fim_iso)
+
+                if conflitos:
+                    conn.execute("ROLLBACK")
+                else:
+                    record_id, seq, criado_em = insert_apontamento(conn, request)
+                    conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
         finally:
             conn.close()
 
+        if conflitos:
+            return JSONResponse(status_code=409, content={"duplicata": True, "registros": conflitos})
+
+        history_cache.on_insert(seq, request.colaborador.strip(), inicio_iso, fim_iso)
+
         return {
             "id": record_id,
             "mensagem": "Apontamento salvo com sucesso!",
@@ -480,42 +972,122 @@ async def salvar_apontamento(request: SaveRequest):
             "criado_em": criado_em,
         }
 
+    except PartitionFrozenError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao salvar apontamento: {str(e)}")
 
 
+# Acima disso, um cliente desatualizado recebe a lista completa em vez do delta
+MAX_DELTA_CHANGES = CHANGE_LOG_KEEP
+
+
 @app.get("/api/historico")
 async def get_historico(
     colaborador: Optional[str] = Query(None, description="Filtrar por nome do colaborador"),
-    mes: Optional[str] = Query(None, description="Filtrar por mês no formato YYYY-MM")
+    mes: Optional[str] = Query(None, description="Filtrar por mês no formato YYYY-MM"),
+    since: Optional[int] = Query(None, description="Cursor da última sincronização (retorna só as alterações)"),
 ):
     """
     Retorna o histórico de apontamentos.
-    Parâmetros opcionais: colaborador (texto), mes (YYYY-MM).
+    Parâmetros opcionais: colaborador (texto), mes (YYYY-MM), since (cursor).
+
+    Toda resposta traz `cursor`. Com `since`, retorna apenas os registros criados
+    (que casam com os filtros) e os ids excluídos desde aquele cursor (`delta: true`);
+    se o cursor for inválido ou muito antigo (anterior à poda do log), retorna a lista
+    completa (`delta: false`, `resync: true`).
     """
     try:
+        # Listagens completas (sem `since`) são servidas do cache quando possível
+        cache_key = listing_key(colaborador, mes) if since is None else None
+        if cache_key is not None:
+            cached = history_cache.get_listing(cache_key)
+            if cached is not None:
+                return cached
+
         conn = get_db()
         try:
-            query = "SELECT id, colaborador, periodo_inicio, periodo_fim, total_horas, criado_em FROM apontamentos WHERE 1=1"
+            # Cursor lido antes da listagem: uma gravação concorrente aparece de novo no próximo
+            # delta (o cliente aplica por id), nunca se perde
+            cursor = current_change_seq(conn)
+
+            where = " WHERE 1=1"
             params = []
+            index_hint = ""
+            sem_resultado = False
 
+            # Trecho do nome: o LIKE percorre só a tabela de nomes distintos, e os registros dos
+            # nomes encontrados vêm pelo índice LOWER(colaborador) de cada partição. O INDEXED BY
+            # evita que o planejador prefira percorrer a rowid pelo ORDER BY id DESC LIMIT 100,
+            # o que leria a partição inteira quando o nome é raro
             if colaborador and colaborador.strip():
-                query += " AND LOWER(colaborador) LIKE LOWER(?)"
-                params.append(f"%{colaborador.strip()}%")
-
-            if mes and mes.strip():
-                # mes no formato YYYY-MM → converter para dd/mm/yyyy parcial
-                try:
-                    year, month = mes.strip().split("-")
-                    # Usar % para casar qualquer dia (01-31, 1-9 com 2 dígitos)
-                    query += " AND (periodo_inicio LIKE ? OR periodo_fim LIKE ?)"
-                    params.append(f"%/{month}/{year}")
-                    params.append(f"%/{month}/{year}")
-                except ValueError:
-                    pass  # ignorar filtro de mês inválido
-
-            query += " ORDER BY id DESC LIMIT 100"
-            rows = conn.execute(query, params).fetchall()
+                nomes = [row[0] for row in conn.execute(
+                    "SELECT nome FROM apontamentos_colaboradores WHERE nome LIKE LOWER(?)",
+                    (f"%{colaborador.strip()}%",),
+                )]
+                index_hint = " INDEXED BY idx_apontamentos_colaborador"
+                where += f" AND LOWER(colaborador) IN ({','.join('?' * len(nomes))})"
+                params.extend(nomes)
+                # Nenhum nome casa: não há o que buscar nas partições
+                sem_resultado = not nomes
+
+            # mes no formato YYYY-MM → faixa yyyy-mm-01..yyyy-mm-31 nas colunas ISO (usa os índices);
+            # filtro de mês inválido é ignorado
+            bounds = month_bounds(mes)
+            if bounds:
+                first_day, last_day = bounds
+                where += " AND (periodo_inicio_iso BETWEEN ? AND ? OR periodo_fim_iso BETWEEN ? AND ?)"
+                params.extend([first_day, last_day, first_day, last_day])
+
+            delta = False
+            removidos = []
+            if since is not None and oldest_change_cursor(conn) <= since <= cursor:
+                changes = conn.execute(
+                    "SELECT apontamento_id, operacao FROM apontamentos_alteracoes WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (since, MAX_DELTA_CHANGES + 1),
+                ).fetchall()
+                if len(changes) <= MAX_DELTA_CHANGES:
+                    delta = True
+                    criados = set()
+                    for change in changes:
+                        if change["operacao"] == "insert":
+                            criados.add(change["apontamento_id"])
+                        else:
+                            criados.discard(change["apontamento_id"])
+                            removidos.append(change["apontamento_id"])
+
+            rows = []
+            if sem_resultado:
+                pass
+            elif delta:
+                # Cada id criado é buscado direto na partição onde está
+                for ano, ids in history_partitions.locate(conn, criados).items():
+                    schema = history_partitions.attach(conn, ano)
+                    rows.extend(conn.execute(
+                        f"SELECT {HISTORY_SUMMARY_COLUMNS} FROM {schema}.apontamentos{where}"
+                        f" AND id IN ({','.join('?' * len(ids))})",
+                        params + sorted(ids),
+                    ).fetchall())
+            else:
+                # Poda: com filtro de mês, só partições que podem ter períodos no mês. Percorre das
+                # partições com ids mais recentes para as mais antigas e para quando nenhuma das
+                # restantes pode ter um id maior que o centésimo já encontrado
+                partitions = (
+                    history_partitions.overlapping(conn, *bounds) if bounds
+                    else history_partitions.partitions(conn)
+                )
+                for partition in partitions:
+                    if len(rows) >= 100 and partition.max_id < rows[99]["id"]:
+                        break
+                    schema = history_partitions.attach(conn, partition.ano, partition.estado)
+                    rows.extend(conn.execute(
+                        f"SELECT {HISTORY_SUMMARY_COLUMNS} FROM {schema}.apontamentos{index_hint}{where}"
+                        " ORDER BY id DESC LIMIT 100",
+                        params,
+                    ).fetchall())
+                    rows.sort(key=lambda row: row["id"], reverse=True)
+                    del rows[100:]
+            rows.sort(key=lambda row: row["id"], reverse=True)
         finally:
             conn.close()
 
@@ -530,36 +1102,49 @@ async def get_historico(
             }
             for row in rows
         ]
-        return {"registros": result}
+        response = {"registros": result, "cursor": cursor}
+        if since is not None:
+            response["delta"] = delta
+            response["resync"] = not delta
+            response["removidos"] = removidos
+        else:
+            history_cache.put_listing(cache_key, response, filled_seq=cursor)
+        return response
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar histórico: {str(e)}")
 
 
-@app.get("/api/historico/{record_id}")
-async def get_historico_detail(record_id: int):
-    """Retorna detalhe completo de um apontamento (incluindo dias e intervalos)."""
+def load_record(record_id: int) -> Dict:
+    """Busca o detalhe de um apontamento (do cache em memória, se houver). 404 se não existir."""
+    record = history_cache.get_detail(record_id)
+    if record is not None:
+        return record
+
+    conn = get_db()
     try:
-        conn = get_db()
-        try:
+        row = None
+        for ano in history_partitions.locate(conn, [record_id]):
+            schema = history_partitions.attach(conn, ano)
             row = conn.execute(
-                "SELECT * FROM apontamentos WHERE id = ?", (record_id,)
+                f"SELECT * FROM {schema}.apontamentos WHERE id = ?", (record_id,)
             ).fetchone()
-        finally:
-            conn.close()
+    finally:
+        conn.close()
 
-        if not row:
-            raise HTTPException(status_code=404, detail="Registro não encontrado")
+    if not row:
+        raise HTTPException(status_code=404, detail="Registro não encontrado")
+
+    record = row_to_record(row)
+    history_cache.put_detail(record_id, record)
+    return record
 
-        return {
-            "id": row["id"],
-            "colaborador": row["colaborador"],
-            "periodo_inicio": row["periodo_inicio"],
-            "periodo_fim": row["periodo_fim"],
-            "total_horas": row["total_horas"],
-            "criado_em": row["criado_em"],
-            "dias": json.loads(row["dados_json"]),
-        }
+
+@app.get("/api/historico/{record_id}")
+async def get_historico_detail(record_id: int):
+    """Retorna detalhe completo de um apontamento (incluindo dias e intervalos)."""
+    try:
+        return load_record(record_id)
 
     except HTTPException:
         raise
@@ -567,27 +1152,73 @@ async def get_historico_detail(record_id: int):
         raise HTTPException(status_code=500, detail=f"Erro ao buscar registro: {str(e)}")
 
 
+@app.get("/api/historico/{record_id}/export")
+async def export_historico(
+    record_id: int,
+    formato: str = Query("xlsx", description="Formato do arquivo: xlsx ou csv"),
+):
+    """
+    Exporta um apontamento salvo (xlsx ou csv).
+    O arquivo é gerado uma única vez e servido do cache em disco nas próximas chamadas.
+    """
+    builders = {
+        "xlsx": (build_record_workbook, XLSX_MEDIA_TYPE),
+        "csv": (build_record_csv, CSV_MEDIA_TYPE),
+    }
+    if formato not in builders:
+        raise HTTPException(status_code=400, detail="Formato inválido. Use xlsx ou csv")
+
+    try:
+        record = load_record(record_id)
+        digest = content_hash(record)
+        builder, media_type = builders[formato]
+
+        path = export_cache.get(record_id, digest, formato)
+        if path is None:
+            content = await run_in_threadpool(builder, record)
+            path = export_cache.put(record_id, digest, formato, content)
+
+        return FileResponse(path, media_type=media_type, filename=f"apontamento_{record_id}.{formato}")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao exportar registro: {str(e)}")
+
+
 @app.delete("/api/historico/{record_id}")
 async def delete_historico(record_id: int):
     """Remove um apontamento do histórico pelo ID."""
     try:
         conn = get_db()
         try:
-            result = conn.execute(
-                "DELETE FROM apontamentos WHERE id = ?", (record_id,)
-            )
+            deleted = 0
+            for ano in history_partitions.locate(conn, [record_id]):
+                schema = history_partitions.attach(conn, ano)
+                conn.execute("DELETE FROM apontamentos_ids WHERE id = ?", (record_id,))
+                # Verificado já com o lock de escrita: não corre com um congelamento em andamento
+                history_partitions.check_writable(conn, ano)
+                deleted = conn.execute(
+                    f"DELETE FROM {schema}.apontamentos WHERE id = ?", (record_id,)
+                ).rowcount
+            if deleted:
+                seq = log_change(conn, record_id, "delete")
             conn.commit()
-            deleted = result.rowcount
         finally:
             conn.close()
 
         if deleted == 0:
             raise HTTPException(status_code=404, detail="Registro não encontrado")
 
+        history_cache.on_delete(seq, record_id)
+        export_cache.invalidate(record_id)
+
         return {"mensagem": "Registro excluído com sucesso", "id": record_id}
 
     except HTTPException:
         raise
+    except PartitionFrozenError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao excluir registro: {str(e)}")
 
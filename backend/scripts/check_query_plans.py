@@ -0,0 +1,276 @@
+"""
+Regressão de plano de consulta - Sistema de Apontamento de Horas
+Executa os endpoints de histórico contra uma massa grande de dados, captura
+todas as consultas SQL que o app.py dispara, roda EXPLAIN QUERY PLAN em cada
+uma e falha (exit code 1) se alguma fizer varredura completa de tabela.
+Também mede o tempo de cada endpoint.
+
+Uso (a partir da pasta backend):
+    python scripts/check_query_plans.py --records 200000
+    python scripts/check_query_plans.py --db /tmp/grande.db     # banco já gerado
+
+Sem --db, gera um banco temporário com scripts/generate_dataset.py.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# Varreduras aceitas conscientemente. Cada entrada: (regex sobre o SQL, regex sobre o passo
+# SCAN do plano, justificativa); uma consulta só passa se todas as suas varreduras forem aceitas.
+ALLOWED_SCANS = [
+    (
+        r"FROM (\w+\.)?apontamentos WHERE 1=1 ORDER BY id DESC LIMIT 100$",
+        r"^SCAN (\w+\.)?apontamentos$",
+        "listagem sem filtro: percorre a rowid em ordem decrescente e para nos 100 primeiros",
+    ),
+    (
+        r"^SELECT nome FROM apontamentos_colaboradores WHERE nome LIKE ",
+        r"^SCAN apontamentos_colaboradores$",
+        "busca por trecho do nome: o LIKE '%...%' percorre só a tabela de nomes distintos "
+        "(uma linha por colaborador); os registros vêm pelo índice LOWER(colaborador)",
+    ),
+    (
+        r"FROM apontamentos_particoes ORDER BY max_id DESC$",
+        r"^SCAN (main\.)?apontamentos_particoes$",
+        "catálogo de partições: uma linha por ano",
+    ),
+]
+
+
+class QueryRecorder:
+    """Captura o SQL (com parâmetros expandidos) de todas as conexões abertas por get_db."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, sql: str):
+        normalized = " ".join(sql.split())
+        if normalized.upper().startswith(("SELECT", "DELETE", "UPDATE", "WITH")):
+            self.statements.append(normalized)
+
+
+def install_recorder(app_module, recorder: QueryRecorder):
+    original_get_db = app_module.get_db
+
+    def get_db_traced():
+        conn = original_get_db()
+        conn.set_trace_callback(recorder)
+        return conn
+
+    app_module.get_db = get_db_traced
+
+
+def explain(app_module, get_db, sql: str) -> list:
+    conn = get_db()
+    try:
+        # Partições anuais referenciadas pelo SQL (p2023.apontamentos etc.)
+        for ano in sorted(set(re.findall(r"\bp(\d{4})\.", sql))):
+            app_module.history_partitions.attach(conn, int(ano))
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    finally:
+        conn.close()
+
+
+def full_scans(plan: list) -> list:
+    """Linhas do plano que percorrem uma tabela/índice inteiro."""
+    return [step for step in plan if step.startswith("SCAN") and step != "SCAN CONSTANT ROW"]
+
+
+def allowed_reason(sql: str, scans: list):
+    """Justificativas das varreduras, ou None se alguma delas não estiver na lista."""
+    reasons = []
+    for step in scans:
+        reason = next(
+            (reason for sql_pattern, step_pattern, reason in ALLOWED_SCANS
+             if re.search(sql_pattern, sql) and re.search(step_pattern, step)),
+            None,
+        )
+        if reason is None:
+            return None
+        if reason not in reasons:
+            reasons.append(reason)
+    return "; ".join(reasons)
+
+
+def time_call(coro_factory, repeat: int) -> list:
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        asyncio.run(coro_factory())
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return tempos
+
+
+def build_scenarios(app_module, nomes: list, max_id: int, rng: random.Random) -> list:
+    """Cenários (nome, fábrica de corrotina) cobrindo todas as consultas do histórico."""
+    nome = rng.choice(nomes)
+    parte_nome = nome.split()[0][:4]
+    mes = "2023-06"
+    # Mês no início da massa: a poda por catálogo descarta as partições posteriores
+    mes_antigo = "2020-03"
+
+    save_payload = app_module.SaveRequest(
+        colaborador=nome,
+        periodo_inicio="01/06/2023",
+        periodo_fim="30/06/2023",
+        total_horas=160.0,
+        dias=[app_module.DayDetail(date="01/06/2023", day_name="Quinta",
+                                   intervals=[app_module.IntervalDetail(entry="08:00", exit="12:00")])],
+    )
+    # Mesmo colaborador e período de save_payload: depois de salvar(), sempre há conflito (409)
+    checked_conflict = app_module.SaveCheckedRequest(**save_payload.model_dump())
+    # Colaborador novo com período que abrange todas as partições: verifica tudo e grava
+    checked_new = app_module.SaveCheckedRequest(**{
+        **save_payload.model_dump(),
+        "colaborador": "Verificação de Plano",
+        "periodo_inicio": "01/01/2020",
+        "periodo_fim": "31/12/2025",
+    })
+    criados = []
+    cursores = []
+
+    async def salvar():
+        criados.append((await app_module.salvar_apontamento(save_payload))["id"])
+
+    async def salvar_verificado_conflito():
+        response = await app_module.salvar_apontamento_verificado(checked_conflict)
+        assert response.status_code == 409, "esperado conflito com o registro de salvar()"
+
+    async def salvar_verificado():
+        # Nome diferente a cada repetição: senão a segunda chamada conflitaria com a primeira
+        payload = checked_new.model_copy(update={"colaborador": f"{checked_new.colaborador} {len(criados)}"})
+        criados.append((await app_module.salvar_apontamento_verificado(payload))["id"])
+
+    async def delta():
+        # Cursor pouco atrás do atual: exercita o caminho do delta (alterações por id), não a lista completa
+        if not cursores:
+            cursores.append((await app_module.get_historico(colaborador=None, mes=None, since=None))["cursor"])
+        await app_module.get_historico(colaborador=None, mes=None, since=max(cursores[0] - 5, 0))
+
+    async def excluir():
+        if criados:
+            await app_module.delete_historico(criados.pop())
+
+    return [
+        ("historico (sem filtro)", lambda: app_module.get_historico(colaborador=None, mes=None, since=None)),
+        ("historico (colaborador)", lambda: app_module.get_historico(colaborador=parte_nome, mes=None, since=None)),
+        ("historico (mes)", lambda: app_module.get_historico(colaborador=None, mes=mes, since=None)),
+        ("historico (colaborador+mes)", lambda: app_module.get_historico(colaborador=parte_nome, mes=mes, since=None)),
+        ("historico (mes antigo, poda)", lambda: app_module.get_historico(colaborador=None, mes=mes_antigo, since=None)),
+        ("historico (colaborador raro)", lambda: app_module.get_historico(colaborador="zqxw", mes=None, since=None)),
+        ("verificar-duplicata", lambda: app_module.verificar_duplicata(
+            colaborador=nome, periodo_inicio="10/06/2023", periodo_fim="20/06/2023")),
+        ("historico/{id}", lambda: app_module.get_historico_detail(rng.randint(1, max_id))),
+        ("salvar-apontamento", salvar),
+        ("salvar-verificado (409)", salvar_verificado_conflito),
+        ("salvar-verificado (grava)", salvar_verificado),
+        ("historico (delta since)", delta),
+        ("delete historico/{id}", excluir),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Falha se alguma consulta do app.py fizer varredura completa de tabela")
+    parser.add_argument("--db", default=None, help="Banco já populado (senão, gera um temporário)")
+    parser.add_argument("--records", type=int, default=200_000, help="Registros a gerar quando --db não é informado")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetições por endpoint para medir tempo")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.db:
+        db_path = Path(args.db)
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix="apontamentos-plano-")
+        db_path = Path(tmpdir.name) / "grande.db"
+
+    os.environ["APONTAMENTOS_DB_PATH"] = str(db_path)
+    import app as app_module
+    from generate_dataset import generate
+
+    try:
+        if args.db:
+            app_module.init_db()
+        else:
+            print(f"Gerando {args.records} registros em {db_path} ...")
+            generate(db_path, args.records, 2_000, 2020, 2025, args.seed)
+
+        conn = app_module.get_db()
+        try:
+            max_id = conn.execute("SELECT MAX(id) FROM apontamentos_ids").fetchone()[0] or 1
+            total = conn.execute("SELECT COUNT(*) FROM apontamentos_ids").fetchone()[0]
+            nomes = []
+            for partition in app_module.history_partitions.partitions(conn):
+                schema = app_module.history_partitions.attach(conn, partition.ano)
+                nomes.extend(row[0] for row in conn.execute(
+                    f"SELECT colaborador FROM {schema}.apontamentos WHERE id % 997 = 0 LIMIT 10"
+                ))
+        finally:
+            conn.close()
+        nomes = nomes or ["Fulano"]
+
+        # Mede o banco, não o cache em memória
+        app_module.history_cache.max_listings = 0
+        app_module.history_cache.max_details = 0
+
+        recorder = QueryRecorder()
+        get_db_plain = app_module.get_db
+        install_recorder(app_module, recorder)
+        rng = random.Random(args.seed)
+
+        print(f"\nBanco: {db_path} ({total} registros)\n")
+        print(f"{'endpoint':<30} {'mediana ms':>11} {'p95 ms':>8} {'máx ms':>8}")
+        for nome, factory in build_scenarios(app_module, nomes, max_id, rng):
+            tempos = sorted(time_call(factory, args.repeat))
+            p95 = tempos[min(len(tempos) - 1, int(0.95 * len(tempos)))]
+            print(f"{nome:<30} {statistics.median(tempos):>11.2f} {p95:>8.2f} {tempos[-1]:>8.2f}")
+
+        falhas = 0
+        vistos = set()
+        print("\nPlanos de consulta:")
+        for sql in recorder.statements:
+            # Mesma consulta com parâmetros diferentes tem o mesmo plano
+            chave = re.sub(r"'[^']*'|\b\d+\b", "?", sql)
+            if chave in vistos:
+                continue
+            vistos.add(chave)
+
+            plan = explain(app_module, get_db_plain, sql)
+            scans = full_scans(plan)
+            motivo = allowed_reason(sql, scans) if scans else None
+            if scans and not motivo:
+                falhas += 1
+                status = "FALHA"
+            elif scans:
+                status = "PERMITIDO"
+            else:
+                status = "OK"
+            print(f"\n[{status}] {sql[:160]}")
+            for step in plan:
+                print(f"    {step}")
+            if motivo:
+                print(f"    -> {motivo}")
+
+        if falhas:
+            print(f"\n{falhas} consulta(s) com varredura completa de tabela.")
+            sys.exit(1)
+        print("\nNenhuma varredura completa inesperada.")
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
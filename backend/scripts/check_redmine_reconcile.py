@@ -0,0 +1,152 @@
+"""
+Verificação da conciliação com o Redmine - Sistema de Apontamento de Horas
+Sobe o Redmine falso (scripts/redmine_stub.py) numa porta local, aponta o app para
+ele e confere /api/redmine/reconciliar contra os lançamentos sintéticos do stub:
+paginação, totais por dia, situações e os erros esperados (400/502). Falha
+(exit code 1) se alguma verificação não passar.
+
+Uso (a partir da pasta backend):
+    python scripts/check_redmine_reconcile.py
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+USER_ID = 7
+# Período longo o bastante para o stub paginar (mais de 100 lançamentos)
+START, END = date(2024, 3, 1), date(2024, 5, 31)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(port: int):
+    """Sobe o stub com uvicorn numa thread (encerrada junto com o processo)."""
+    import uvicorn
+    from redmine_stub import STUB_API_KEY, create_stub_app
+
+    server = uvicorn.Server(uvicorn.Config(create_stub_app(STUB_API_KEY), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            sys.exit("Redmine stub não subiu")
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    from redmine_stub import STUB_API_KEY, synthetic_entries
+
+    tmpdir = tempfile.TemporaryDirectory(prefix="apontamentos-redmine-")
+    port = free_port()
+    os.environ["APONTAMENTOS_DB_PATH"] = str(Path(tmpdir.name) / "check.db")
+    os.environ["MAINTENANCE_ENABLED"] = "0"
+    os.environ["REDMINE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["REDMINE_API_KEY"] = STUB_API_KEY
+
+    import app as app_module
+    from fastapi.testclient import TestClient
+    from services.redmine_service import RedmineError, reconcile
+
+    server = start_stub(port)
+    falhas = []
+
+    def check(nome: str, ok: bool, detalhe: str = ""):
+        print(f"{'OK  ' if ok else 'FALHOU'} {nome}{f' ({detalhe})' if detalhe and not ok else ''}")
+        if not ok:
+            falhas.append(nome)
+
+    # Horas esperadas por dia, direto da fonte do stub
+    lancado = defaultdict(float)
+    entries = synthetic_entries(USER_ID, START, END)
+    for entry in entries:
+        lancado[entry["spent_on"]] += entry["hours"]
+
+    try:
+        with TestClient(app_module.app) as client:
+            total_days = (END - START).days + 1
+            analysis = client.post("/api/analyze", json={
+                "selection_type": "period",
+                "start_date": START.strftime("%d/%m/%Y"),
+                "end_date": END.strftime("%d/%m/%Y"),
+                "state": "SP",
+                "worked_hours": ["08:00"] * total_days,
+            })
+            check("análise do período", analysis.status_code == 200, analysis.text[:200])
+            days = analysis.json()["days"]
+
+            def reconciliar(dias, user_id=USER_ID):
+                return client.post("/api/redmine/reconciliar", json={"user_id": user_id, "days": dias})
+
+            response = reconciliar(days)
+            check("conciliação responde 200", response.status_code == 200, response.text[:200])
+            result = response.json()
+            itens = {item["date"]: item for item in result["itens"]}
+
+            check("paginação: todos os lançamentos considerados", len(entries) > 100
+                  and round(result["resumo"]["total_lancado"], 2) == round(sum(lancado.values()), 2),
+                  f"{len(entries)} lançamentos, total {result['resumo']['total_lancado']}")
+            divergencias = [
+                d["date"] for d in days
+                if round(itens[d["date"]]["lancado"], 2) != round(lancado.get(
+                    date(*map(int, reversed(d["date"].split("/")))).isoformat(), 0.0), 2)
+            ]
+            check("horas lançadas por dia", not divergencias, ", ".join(divergencias[:5]))
+            check("itens em ordem de data", [i["date"] for i in result["itens"]] == [d["date"] for d in days])
+            check("resumo soma o total de dias", sum(
+                result["resumo"][s] for s in ("confere", "divergente", "nao_lancado", "lancado_em_dia_ignorado",
+                                              "sem_apontamento")
+            ) == result["resumo"]["total_dias"] == total_days)
+
+            response = reconciliar(list(reversed(days)))
+            check("dias fora de ordem dão o mesmo resultado", response.status_code == 200
+                  and response.json() == result, response.text[:200])
+
+            response = reconciliar(days + [dict(days[10])])
+            check("data repetida é recusada (400)", response.status_code == 400, f"{response.status_code} {response.text[:200]}")
+
+            response = reconciliar([{"date": "31/02/2024"}, {"foo": 1}])
+            check("nenhum dia válido (400)", response.status_code == 400, f"{response.status_code}")
+
+            app_module.redmine_client = None
+            os.environ["REDMINE_API_KEY"] = "errada"
+            response = reconciliar(days)
+            check("chave recusada pelo Redmine (502)", response.status_code == 502, f"{response.status_code}")
+    finally:
+        server.should_exit = True
+
+    # Lançamentos malformados vindos do Redmine (o stub só gera valores válidos)
+    dia = {"date": "01/03/2024", "redmine_value": 8.0, "is_ignored": False}
+    for horas in ("abc", float("nan"), [8]):
+        try:
+            reconcile([dia], [{"id": 1, "spent_on": "2024-03-01", "hours": horas}])
+            check(f"horas inválidas ({horas!r}) geram RedmineError", False, "nenhum erro")
+        except RedmineError:
+            check(f"horas inválidas ({horas!r}) geram RedmineError", True)
+    item = reconcile([dia], [{"id": 1, "spent_on": "2024-03-01", "hours": "8.0"}, {"id": 2, "spent_on": "2024-03-01"}])
+    check("horas em texto numérico e ausentes", item["itens"][0]["situacao"] == "confere", str(item["itens"]))
+
+    tmpdir.cleanup()
+    if falhas:
+        print(f"\n{len(falhas)} verificação(ões) falharam")
+        sys.exit(1)
+    print("\nConciliação OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Congelamento de partições anuais do histórico - Sistema de Apontamento de Horas
+Depois de congelada, a partição de um ano é compactada (VACUUM), sai do modo WAL,
+fica somente leitura no disco e passa a ser anexada sem locks; inclusões e
+exclusões naquele ano são recusadas pela API (409).
+
+Uso (a partir da pasta backend):
+    python scripts/freeze_partition.py --listar
+    python scripts/freeze_partition.py --ano 2022                   # imutável
+    python scripts/freeze_partition.py --ano 2022 --modo leitura    # somente leitura (mode=ro)
+    python scripts/freeze_partition.py --ano 2022 --reabrir
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+ESTADOS = {0: "gravável", 1: "somente leitura", 2: "imutável"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Congela (ou reabre) a partição de um ano do histórico")
+    parser.add_argument("--db", default=None, help="Banco principal (padrão: APONTAMENTOS_DB_PATH ou backend/apontamentos.db)")
+    parser.add_argument("--ano", type=int, help="Ano da partição")
+    parser.add_argument("--modo", choices=["imutavel", "leitura"], default="imutavel")
+    parser.add_argument("--reabrir", action="store_true", help="Volta a permitir gravações no ano")
+    parser.add_argument("--listar", action="store_true", help="Mostra as partições e seus estados")
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ["APONTAMENTOS_DB_PATH"] = args.db
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app
+    from services.partitions import IMUTAVEL, SOMENTE_LEITURA
+
+    app.init_db()
+    conn = app.get_db()
+    try:
+        if args.ano is not None and not args.listar:
+            if args.reabrir:
+                app.history_partitions.unfreeze(conn, args.ano)
+            else:
+                estado = IMUTAVEL if args.modo == "imutavel" else SOMENTE_LEITURA
+                app.history_partitions.freeze(conn, args.ano, estado)
+
+        print(f"{'ano':>6} {'maior id':>10} {'maior fim':>12}  estado")
+        for partition in sorted(app.history_partitions.partitions(conn), key=lambda p: p.ano):
+            ano = partition.ano or "sem data"
+            print(f"{ano:>6} {partition.max_id:>10} {partition.max_fim_iso or '-':>12}  {ESTADOS[partition.estado]}")
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
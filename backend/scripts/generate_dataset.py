@@ -0,0 +1,202 @@
+"""
+Gerador de massa de dados - Sistema de Apontamento de Horas
+Preenche o histórico (partições anuais de `apontamentos`) com colaboradores,
+períodos e dias/intervalos realistas, na escala desejada (ex: 1 milhão de registros).
+
+Uso (a partir da pasta backend):
+    python scripts/generate_dataset.py --db /tmp/grande.db --records 1000000
+
+O esquema (tabelas, índices e partições) é criado pelo próprio app (init_db e
+history_partitions), então o banco gerado é idêntico ao de produção.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+NOMES = [
+    "Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+    "Karina", "Lucas", "Mariana", "Nicolas", "Otávio", "Paula", "Rafael", "Sabrina", "Thiago", "Vitória",
+]
+SOBRENOMES = [
+    "Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Almeida",
+    "Ferreira", "Rodrigues", "Gomes", "Martins", "Araújo", "Barbosa", "Ribeiro", "Carvalho",
+]
+DIAS_SEMANA = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+
+
+def build_colaboradores(rng: random.Random, total: int) -> list:
+    """Nomes compostos únicos (nome + dois sobrenomes + sufixo numérico quando esgota)."""
+    nomes = set()
+    while len(nomes) < total:
+        nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+        if nome in nomes:
+            nome = f"{nome} {len(nomes)}"
+        nomes.add(nome)
+    return sorted(nomes)
+
+
+def random_period(rng: random.Random, first_year: int, last_year: int) -> tuple:
+    """Maioria mensal (dia 1 ao fim do mês); o resto quinzenal ou pontual."""
+    year = rng.randint(first_year, last_year)
+    month = rng.randint(1, 12)
+    inicio = date(year, month, 1)
+    proximo = date(year + (month == 12), month % 12 + 1, 1)
+    fim_mes = proximo - timedelta(days=1)
+
+    sorteio = rng.random()
+    if sorteio < 0.7:
+        return inicio, fim_mes
+    if sorteio < 0.9:
+        inicio = inicio if rng.random() < 0.5 else date(year, month, 16)
+        return inicio, min(inicio + timedelta(days=14), fim_mes)
+    dia = inicio + timedelta(days=rng.randint(0, (fim_mes - inicio).days))
+    return dia, dia
+
+
+def build_dias(rng: random.Random, inicio: date, fim: date) -> tuple:
+    """Payload de dias no mesmo formato salvo pelo frontend (DayDetail). Retorna (dias, total_horas)."""
+    dias = []
+    total = 0.0
+    atual = inicio
+    while atual <= fim:
+        ignorado = atual.weekday() >= 5 or rng.random() < 0.03
+        if ignorado:
+            intervals = [{"entry": "", "exit": ""}]
+            horas = 0.0
+        else:
+            entrada = 7 * 60 + 30 + rng.randint(0, 60)
+            almoco = entrada + 4 * 60 + rng.randint(-10, 20)
+            volta = almoco + 60 + rng.randint(0, 15)
+            saida = volta + 4 * 60 + rng.randint(-20, 40)
+            intervals = [
+                {"entry": f"{entrada // 60:02d}:{entrada % 60:02d}", "exit": f"{almoco // 60:02d}:{almoco % 60:02d}"},
+                {"entry": f"{volta // 60:02d}:{volta % 60:02d}", "exit": f"{saida // 60:02d}:{saida % 60:02d}"},
+            ]
+            horas = round(((almoco - entrada) + (saida - volta)) / 60, 2)
+        total += horas
+        extra = max(0, round((horas - 8) * 60))
+        falta = max(0, round((8 - horas) * 60)) if not ignorado else 0
+        dias.append({
+            "date": atual.strftime("%d/%m/%Y"),
+            "day_name": DIAS_SEMANA[atual.weekday()],
+            "intervals": intervals,
+            "total_hours": horas,
+            "overtime": f"{extra // 60:02d}:{extra % 60:02d}",
+            "absence": f"{falta // 60:02d}:{falta % 60:02d}",
+            "is_ignored": ignorado,
+            "ignore_reason": ("Final de Semana" if atual.weekday() >= 5 else "Atestado") if ignorado else "",
+        })
+        atual += timedelta(days=1)
+    return dias, round(total, 2)
+
+
+def generate(db_path: Path, records: int, colaboradores: int, first_year: int, last_year: int,
+             seed: int, batch_size: int = 5000, verbose: bool = True):
+    """Cria o esquema via app.init_db e insere `records` apontamentos em lotes."""
+    os.environ["APONTAMENTOS_DB_PATH"] = str(db_path)
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app
+
+    app.DB_PATH = Path(db_path)
+    app.history_partitions = app.HistoryPartitions(app.DB_PATH)
+    app.init_db()
+    partitions = app.history_partitions
+
+    rng = random.Random(seed)
+    nomes = build_colaboradores(rng, colaboradores)
+
+    # Mesma conexão do app (uri=True): as partições são anexadas por URI file:
+    conn = app.get_db()
+    # Carga em massa: durabilidade não importa aqui (o modo WAL do app é mantido)
+    conn.execute("PRAGMA synchronous = OFF")
+    for ano in range(first_year, last_year + 1):
+        partitions.ensure(conn, ano)
+
+    def attach_for_load(ano: int) -> str:
+        """Anexa a partição do ano (fora de transação; pode desanexar outra pelo limite de ATTACH)."""
+        schema = partitions.schema(ano)
+        if schema not in {row[1] for row in conn.execute("PRAGMA database_list")}:
+            conn.commit()
+            partitions.attach(conn, ano)
+            conn.execute(f"PRAGMA {schema}.synchronous = OFF")
+        return schema
+
+    inicio_carga = time.perf_counter()
+    inseridos = 0
+    try:
+        while inseridos < records:
+            lote = {}
+            for _ in range(min(batch_size, records - inseridos)):
+                inicio, fim = random_period(rng, first_year, last_year)
+                dias, total_horas = build_dias(rng, inicio, fim)
+                criado = fim + timedelta(days=rng.randint(0, 10))
+                nome = rng.choice(nomes)
+                lote.setdefault(inicio.year, []).append((
+                    nome if rng.random() < 0.9 else nome.upper(),
+                    inicio.strftime("%d/%m/%Y"),
+                    fim.strftime("%d/%m/%Y"),
+                    total_horas,
+                    f"{criado.strftime('%d/%m/%Y')} {rng.randint(8, 18):02d}:{rng.randint(0, 59):02d}",
+                    json.dumps(dias, ensure_ascii=False),
+                    inicio.isoformat(),
+                    fim.isoformat(),
+                ))
+            # Ids globais explícitos no índice (o AUTOINCREMENT acompanha), registros roteados
+            # para a partição do ano
+            for ano, linhas in lote.items():
+                schema = attach_for_load(ano)
+                proximo = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM sqlite_sequence WHERE name = 'apontamentos_ids'"
+                ).fetchone()[0]
+                ids = range(proximo, proximo + len(linhas))
+                conn.executemany("INSERT INTO apontamentos_ids (id, ano) VALUES (?, ?)", [(i, ano) for i in ids])
+                conn.executemany(
+                    f"""
+                    INSERT INTO {schema}.apontamentos (id, colaborador, periodo_inicio, periodo_fim,
+                        total_horas, criado_em, dados_json, periodo_inicio_iso, periodo_fim_iso)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [(i, *linha) for i, linha in zip(ids, linhas)],
+                )
+                partitions.register_names(conn, [linha[0] for linha in linhas])
+                inseridos += len(linhas)
+            conn.commit()
+            if verbose:
+                elapsed = time.perf_counter() - inicio_carga
+                print(f"\r{inseridos}/{records} registros ({inseridos / elapsed:.0f}/s)", end="", flush=True)
+        for ano in range(first_year, last_year + 1):
+            attach_for_load(ano)
+            partitions.refresh_bounds(conn, ano)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    if verbose:
+        print()
+    return nomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera massa de dados sintética para o histórico de apontamentos")
+    parser.add_argument("--db", required=True, help="Caminho do arquivo .db a ser criado/preenchido")
+    parser.add_argument("--records", type=int, default=100_000, help="Quantidade de apontamentos")
+    parser.add_argument("--colaboradores", type=int, default=2_000, help="Quantidade de colaboradores distintos")
+    parser.add_argument("--first-year", type=int, default=2020)
+    parser.add_argument("--last-year", type=int, default=date.today().year)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    generate(Path(args.db), args.records, args.colaboradores, args.first_year, args.last_year, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""
+Gerador de carga - Sistema de Apontamento de Horas
+Sobe uma instância local do uvicorn (com banco temporário) e reproduz um mix
+realista de tráfego: análises, salvamentos, listagens, detalhes e exportações.
+Salvamentos e listagens seguem o frontend: salvamento verificado (o 409 de período
+sobreposto aparece como "salvar-409") e atualização da lista por `since`
+("historico-delta").
+
+Uso (a partir da pasta backend):
+    python scripts/load_test.py --concurrency 20 --duration 30
+
+Não depende de nenhum serviço externo nem de bibliotecas além das do backend:
+o cliente HTTP/1.1 (com keep-alive) é implementado sobre asyncio streams.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+ESTADOS = [
+    "AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG",
+    "PA", "PB", "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO"
+]
+
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Almeida"]
+
+# Peso relativo de cada tipo de requisição no mix de tráfego
+MIX_PADRAO = {
+    "analyze": 40,
+    "salvar": 10,
+    "historico": 25,
+    "detalhe": 15,
+    "export": 10,
+}
+
+
+# ============ CLIENTE HTTP ============
+
+class HttpConnection:
+    """Conexão HTTP/1.1 persistente (keep-alive) mínima sobre asyncio."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def _ensure_open(self):
+        if self.writer is None or self.writer.is_closing():
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            self.writer = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes] = None,
+                      content_type: str = "application/json") -> Tuple[int, bytes]:
+        """Envia uma requisição e retorna (status, corpo). Reconecta uma vez se o servidor fechou."""
+        for tentativa in range(2):
+            await self._ensure_open()
+            try:
+                return await self._send(method, path, body, content_type)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if tentativa == 1:
+                    raise
+        raise ConnectionError("Falha ao enviar requisição")
+
+    async def _send(self, method, path, body, content_type) -> Tuple[int, bytes]:
+        headers = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Connection: keep-alive",
+        ]
+        if body is not None:
+            headers.append(f"Content-Type: {content_type}")
+            headers.append(f"Content-Length: {len(body)}")
+        raw = ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + (body or b"")
+        self.writer.write(raw)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size_line = await self.reader.readuntil(b"\r\n")
+                size = int(size_line.split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            payload = b"".join(chunks)
+        else:
+            payload = await self.reader.readexactly(int(response_headers.get("content-length", "0")))
+
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+
+        return status, payload
+
+
+# ============ GERAÇÃO DE TRÁFEGO ============
+
+def random_period(rng: random.Random) -> Tuple[date, date]:
+    """Período aleatório entre 1 e 31 dias, de 2023 até o ano corrente."""
+    inicio = date(2023, 1, 1) + timedelta(days=rng.randint(0, 365 * 3))
+    fim = inicio + timedelta(days=rng.randint(0, 30))
+    return inicio, fim
+
+
+def random_worked_time(rng: random.Random) -> str:
+    """Horas trabalhadas em torno de 8h, com alguns dias bem fora da jornada."""
+    minutos = int(rng.gauss(480, 25)) if rng.random() < 0.9 else rng.randint(120, 660)
+    minutos = max(0, minutos)
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+def build_analyze_payload(rng: random.Random) -> dict:
+    inicio, fim = random_period(rng)
+    total = (fim - inicio).days + 1
+    return {
+        "selection_type": "period",
+        "start_date": inicio.strftime("%d/%m/%Y"),
+        "end_date": fim.strftime("%d/%m/%Y"),
+        "state": rng.choice(ESTADOS),
+        "worked_hours": [random_worked_time(rng) for _ in range(total)],
+        "manual_exceptions": [],
+    }
+
+
+def build_save_payload(rng: random.Random) -> dict:
+    inicio, fim = random_period(rng)
+    dias = []
+    total_horas = 0.0
+    atual = inicio
+    while atual <= fim:
+        ignorado = atual.weekday() >= 5
+        horas = 0.0 if ignorado else round(rng.gauss(8, 0.4), 2)
+        total_horas += horas
+        dias.append({
+            "date": atual.strftime("%d/%m/%Y"),
+            "day_name": ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"][atual.weekday()],
+            "intervals": [] if ignorado else [
+                {"entry": "08:00", "exit": "12:00"},
+                {"entry": "13:00", "exit": "17:00"},
+            ],
+            "total_hours": horas,
+            "is_ignored": ignorado,
+            "ignore_reason": "Final de Semana" if ignorado else "",
+        })
+        atual += timedelta(days=1)
+    return {
+        "colaborador": f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)}",
+        "periodo_inicio": inicio.strftime("%d/%m/%Y"),
+        "periodo_fim": fim.strftime("%d/%m/%Y"),
+        "total_horas": round(total_horas, 2),
+        "dias": dias,
+    }
+
+
+def build_export_payload(rng: random.Random) -> dict:
+    days = []
+    inicio, fim = random_period(rng)
+    atual = inicio
+    while atual <= fim:
+        worked = random_worked_time(rng)
+        days.append({
+            "date": atual.strftime("%d/%m/%Y"),
+            "day_of_week": "",
+            "worked_time": worked,
+            "redmine_value": worked,
+            "day_type": "",
+            "status": rng.choice(["ok", "divergent", "ignorado"]),
+            "status_description": "",
+        })
+        atual += timedelta(days=1)
+    return {"days": days}
+
+
+class LoadStats:
+    """Acumula latências (ms) e erros por endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool):
+        self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, duration: float) -> str:
+        def percentile(sorted_values, p):
+            if not sorted_values:
+                return 0.0
+            idx = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+            return sorted_values[idx]
+
+        linhas = [
+            f"{'endpoint':<16} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>7} {'erro %':>7}"
+        ]
+        total_reqs = 0
+        total_erros = 0
+        for endpoint in sorted(self.latencies):
+            valores = sorted(self.latencies[endpoint])
+            erros = self.errors.get(endpoint, 0)
+            total_reqs += len(valores)
+            total_erros += erros
+            linhas.append(
+                f"{endpoint:<16} {len(valores):>7} {len(valores) / duration:>8.1f} "
+                f"{percentile(valores, 50):>8.1f} {percentile(valores, 95):>8.1f} {percentile(valores, 99):>8.1f} "
+                f"{erros:>7} {100 * erros / len(valores):>6.2f}%"
+            )
+        if total_reqs:
+            linhas.append(
+                f"{'TOTAL':<16} {total_reqs:>7} {total_reqs / duration:>8.1f} {'':>8} {'':>8} {'':>8} "
+                f"{total_erros:>7} {100 * total_erros / total_reqs:>6.2f}%"
+            )
+        return "\n".join(linhas)
+
+
+class HistoryView:
+    """Estado da lista de histórico de um usuário, como o historyCache do frontend."""
+
+    def __init__(self):
+        self.params: Dict[str, str] = {}
+        self.cursor: Optional[int] = None
+        self.ids: List[int] = []
+
+    def next_params(self, rng: random.Random) -> Dict[str, str]:
+        # Na maior parte das vezes o usuário só atualiza a mesma lista (delta via `since`)
+        if self.cursor is None or rng.random() < 0.2:
+            params = {}
+            if rng.random() < 0.5:
+                params["colaborador"] = rng.choice(NOMES)
+            if rng.random() < 0.3:
+                params["mes"] = f"{rng.randint(2023, 2025)}-{rng.randint(1, 12):02d}"
+            if params != self.params:
+                self.params, self.cursor, self.ids = params, None, []
+        params = dict(self.params)
+        if self.cursor is not None:
+            params["since"] = str(self.cursor)
+        return params
+
+    def apply(self, data: dict):
+        registros = [r["id"] for r in data.get("registros", [])]
+        if data.get("delta"):
+            removidos = set(data.get("removidos", []))
+            merged = sorted(set(registros) | {i for i in self.ids if i not in removidos}, reverse=True)[:100]
+            if len(merged) < 100 <= len(self.ids):
+                # Exclusões deixaram a página incompleta: o frontend recarrega a lista inteira
+                self.cursor, self.ids = None, []
+                return
+            self.ids = merged
+        else:
+            self.ids = registros
+        self.cursor = data.get("cursor")
+
+
+async def run_user(user_id: int, host: str, port: int, deadline: float, mix: Dict[str, int],
+                   saved_ids: List[int], stats: LoadStats, seed: int):
+    """
+    Um 'usuário virtual': mantém uma conexão keep-alive e dispara requisições até o prazo.
+    Salva e lista o histórico como o frontend: salvamento verificado (no 409 de período
+    sobreposto, às vezes confirma com ignorar_duplicata) e atualização da lista por `since`.
+    """
+    rng = random.Random(seed + user_id)
+    conn = HttpConnection(host, port)
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    history = HistoryView()
+
+    async def send(method: str, path: str, body: Optional[dict]) -> Tuple[int, bytes, float]:
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        inicio = time.perf_counter()
+        try:
+            status, resposta = await conn.request(method, path, payload)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+            status, resposta = 0, b""
+        return status, resposta, (time.perf_counter() - inicio) * 1000
+
+    try:
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            if endpoint == "detalhe" and not saved_ids:
+                endpoint = "salvar"
+
+            if endpoint == "salvar":
+                body = build_save_payload(rng)
+                status, resposta, elapsed = await send("POST", "/api/salvar-apontamento-verificado", body)
+                if status == 409 and json.loads(resposta).get("duplicata"):
+                    # Conflito esperado: nada foi gravado e o aviso é mostrado ao usuário
+                    stats.record("salvar-409", elapsed, True)
+                    if rng.random() >= 0.5:
+                        continue
+                    body["ignorar_duplicata"] = True
+                    status, resposta, elapsed = await send("POST", "/api/salvar-apontamento-verificado", body)
+                stats.record("salvar", elapsed, 0 < status < 400)
+                if 0 < status < 400:
+                    saved_ids.append(json.loads(resposta)["id"])
+                continue
+
+            if endpoint == "historico":
+                params = history.next_params(rng)
+                path = "/api/historico" + ("?" + urlencode(params) if params else "")
+                status, resposta, elapsed = await send("GET", path, None)
+                ok = 0 < status < 400
+                if ok:
+                    data = json.loads(resposta)
+                    history.apply(data)
+                    if data.get("delta"):
+                        endpoint = "historico-delta"
+                else:
+                    history.cursor = None
+                stats.record(endpoint, elapsed, ok)
+                continue
+
+            if endpoint == "analyze":
+                method, path, body = "POST", "/api/analyze", build_analyze_payload(rng)
+            elif endpoint == "detalhe":
+                method, path, body = "GET", f"/api/historico/{rng.choice(saved_ids)}", None
+            else:
+                method, path, body = "POST", "/api/export", build_export_payload(rng)
+            status, _, elapsed = await send(method, path, body)
+            stats.record(endpoint, elapsed, 0 < status < 400)
+    finally:
+        await conn.close()
+
+
+# ============ SERVIDOR LOCAL ============
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int, db_path: Path) -> subprocess.Popen:
+    """Sobe o uvicorn apontando para um banco temporário."""
+    env = dict(os.environ, APONTAMENTOS_DB_PATH=str(db_path))
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=str(BACKEND_DIR),
+        env=env,
+    )
+
+
+async def wait_until_ready(host: str, port: int, timeout: float = 30.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        conn = HttpConnection(host, port)
+        try:
+            status, _ = await conn.request("GET", "/api/health")
+            if status == 200:
+                return
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await conn.close()
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Servidor não respondeu em {timeout:.0f}s")
+
+
+async def run_load(host: str, port: int, concurrency: int, duration: float, warmup: float,
+                   mix: Dict[str, int], seed: int) -> LoadStats:
+    saved_ids: List[int] = []
+
+    # Aquecimento: popula alguns registros e descarta as métricas
+    if warmup > 0:
+        deadline = time.monotonic() + warmup
+        await asyncio.gather(*[
+            run_user(i, host, port, deadline, mix, saved_ids, LoadStats(), seed)
+            for i in range(concurrency)
+        ])
+
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*[
+        run_user(i, host, port, deadline, mix, saved_ids, stats, seed + 1000)
+        for i in range(concurrency)
+    ])
+    return stats
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Converte 'analyze=40,historico=25,...' em dicionário de pesos."""
+    mix = dict(MIX_PADRAO)
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        nome, _, peso = item.partition("=")
+        nome = nome.strip()
+        if nome not in MIX_PADRAO:
+            raise argparse.ArgumentTypeError(f"Endpoint desconhecido no mix: {nome}")
+        mix[nome] = int(peso)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga contra uma instância local do backend")
+    parser.add_argument("--concurrency", type=int, default=10, help="Usuários virtuais simultâneos")
+    parser.add_argument("--duration", type=float, default=30.0, help="Duração da medição em segundos")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Aquecimento em segundos (não medido)")
+    parser.add_argument("--workers", type=int, default=1, help="Workers do uvicorn")
+    parser.add_argument("--mix", type=parse_mix, default=dict(MIX_PADRAO),
+                        help="Pesos do tráfego, ex: analyze=40,salvar=10,historico=25,detalhe=15,export=10")
+    parser.add_argument("--url", default=None,
+                        help="Usar um servidor já em execução (ex: http://127.0.0.1:8000) em vez de subir um local")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = None
+    tmpdir = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix="apontamentos-carga-")
+        host, port = "127.0.0.1", free_port()
+        server = start_server(port, args.workers, Path(tmpdir.name) / "carga.db")
+
+    try:
+        asyncio.run(wait_until_ready(host, port))
+        print(f"Carga: {args.concurrency} usuários, {args.duration:.0f}s, mix={args.mix}")
+        stats = asyncio.run(run_load(host, port, args.concurrency, args.duration, args.warmup, args.mix, args.seed))
+        print(stats.report(args.duration))
+    finally:
+        if server is not None:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
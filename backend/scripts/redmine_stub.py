@@ -0,0 +1,97 @@
+"""
+Redmine falso (stub) para desenvolvimento e testes da conciliação.
+Implementa apenas GET /time_entries.json com os mesmos parâmetros e paginação
+da API REST do Redmine, com lançamentos sintéticos e determinísticos.
+
+Uso (a partir da pasta backend):
+    python scripts/redmine_stub.py --port 3001
+    REDMINE_URL=http://127.0.0.1:3001 REDMINE_API_KEY=stub python app.py
+
+Também pode ser usado em processo, via `create_stub_app()`.
+"""
+
+import argparse
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Query
+
+STUB_API_KEY = "stub"
+
+
+def synthetic_entries(user_id: int, from_date: date, to_date: date, seed: int = 0) -> List[Dict]:
+    """
+    Lançamentos de um usuário: dias úteis com 2 a 3 entradas somando ~8h, alguns dias
+    sem lançamento e alguns com valores fora do padrão (para gerar divergências).
+    """
+    entries = []
+    entry_id = user_id * 1_000_000
+    current = from_date
+    while current <= to_date:
+        rng = random.Random(f"{seed}-{user_id}-{current.isoformat()}")
+        if current.weekday() < 5 and rng.random() > 0.05:
+            total = 8.0 if rng.random() < 0.8 else round(rng.uniform(6.0, 9.5), 2)
+            parts = rng.randint(2, 3)
+            split = [round(total / parts, 2)] * (parts - 1)
+            split.append(round(total - sum(split), 2))
+            for hours in split:
+                entry_id += 1
+                entries.append({
+                    "id": entry_id,
+                    "project": {"id": 1, "name": "Projeto"},
+                    "issue": {"id": rng.randint(1000, 9999)},
+                    "user": {"id": user_id, "name": f"Usuário {user_id}"},
+                    "activity": {"id": 9, "name": "Desenvolvimento"},
+                    "hours": hours,
+                    "comments": "",
+                    "spent_on": current.isoformat(),
+                })
+        current += timedelta(days=1)
+    return entries
+
+
+def create_stub_app(api_key: Optional[str] = STUB_API_KEY, seed: int = 0) -> FastAPI:
+    stub = FastAPI(title="Redmine stub")
+
+    @stub.get("/time_entries.json")
+    def time_entries(
+        user_id: int,
+        from_: date = Query(..., alias="from"),
+        to: date = Query(...),
+        limit: int = Query(25, ge=1),
+        offset: int = Query(0, ge=0),
+        x_redmine_api_key: Optional[str] = Header(None),
+    ):
+        if api_key and x_redmine_api_key != api_key:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        # Como o Redmine real: limite máximo de 100 por página
+        limit = min(limit, 100)
+        entries = synthetic_entries(user_id, from_, to, seed)
+        # O Redmine ordena por spent_on decrescente
+        entries.sort(key=lambda e: (e["spent_on"], e["id"]), reverse=True)
+        return {
+            "time_entries": entries[offset:offset + limit],
+            "total_count": len(entries),
+            "offset": offset,
+            "limit": limit,
+        }
+
+    return stub
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Servidor Redmine falso para testes locais")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument("--api-key", default=STUB_API_KEY, help="Chave exigida (vazio para não exigir)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    uvicorn.run(create_stub_app(args.api_key or None, args.seed), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
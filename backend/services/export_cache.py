@@ -0,0 +1,174 @@
+"""
+Cache em disco das exportações de apontamentos salvos.
+Os arquivos são endereçados por id do registro + hash do conteúdo, com despejo
+LRU (pela data de modificação) quando o tamanho total passa do limite.
+
+Arquivos usados há menos de `grace_seconds` nunca são despejados: get/put devolvem o
+caminho e o FileResponse só abre o arquivo depois, ao começar a enviar; despejá-lo nesse
+intervalo (por este ou por outro worker) faria o download falhar. Aberto o arquivo, a
+remoção não afeta mais o envio.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+# Incrementar quando o layout das planilhas/CSV mudar, para não servir arquivos antigos
+EXPORT_FORMAT_VERSION = "1"
+
+# Tempo mínimo, desde o último uso, antes de um arquivo poder ser despejado
+EVICTION_GRACE_SECONDS = 60
+
+
+def content_hash(record: Dict) -> str:
+    """Hash estável do conteúdo exportado de um registro."""
+    payload = json.dumps(
+        [
+            EXPORT_FORMAT_VERSION,
+            record.get("colaborador"),
+            record.get("periodo_inicio"),
+            record.get("periodo_fim"),
+            record.get("total_horas"),
+            record.get("dias"),
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class ExportCache:
+    """
+    Cache de arquivos exportados.
+
+    Args:
+        cache_dir: Pasta dos arquivos (compartilhada entre workers)
+        max_bytes: Tamanho máximo somado dos arquivos antes de despejar os menos usados
+            (pode ser ultrapassado enquanto os arquivos estiverem todos em uso recente)
+        grace_seconds: Tempo desde o último uso em que um arquivo não é despejado
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, grace_seconds: float = EVICTION_GRACE_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._mtimes: Dict[str, float] = {}   # último uso de cada arquivo, lido do disco
+        self._total_bytes = 0
+        self._load()
+
+    def _load(self):
+        """Reconstrói o índice LRU a partir do disco (mais antigo primeiro)."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((name, size) for _, name, size in files)
+        self._mtimes = {name: mtime for mtime, name, _ in files}
+        self._total_bytes = sum(self._entries.values())
+
+    @staticmethod
+    def _name(record_id: int, digest: str, fmt: str) -> str:
+        return f"{record_id}-{digest}.{fmt}"
+
+    def get(self, record_id: int, digest: str, fmt: str) -> Optional[Path]:
+        """Retorna o caminho do arquivo em cache (e o marca como recém-usado) ou None."""
+        name = self._name(record_id, digest, fmt)
+        path = self.cache_dir / name
+        try:
+            # Atualizar mtime mantém a ordem LRU visível para os outros workers
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(name, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if name in self._entries:
+                self._entries.move_to_end(name)
+        return path
+
+    def put(self, record_id: int, digest: str, fmt: str, content: bytes) -> Path:
+        """Grava o arquivo de forma atômica e despeja os menos usados se passar do limite."""
+        name = self._name(record_id, digest, fmt)
+        path = self.cache_dir / name
+        tmp_path = self.cache_dir / f"{name}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[name] = len(content)
+            self._total_bytes += len(content)
+            if self._total_bytes > self.max_bytes:
+                self._evict(keep=name)
+        return path
+
+    def _evict(self, keep: str):
+        """Remove os arquivos menos usados até caber no limite. Chamar com o lock adquirido."""
+        # Outros workers também gravam na pasta: reler o disco antes de decidir
+        self._load()
+        recent = time.time() - self.grace_seconds
+        for name in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            # Em uso recente (talvez ainda não aberto pelo FileResponse que o vai enviar)
+            if name == keep or self._mtimes.get(name, 0) >= recent:
+                continue
+            size = self._entries.pop(name)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.cache_dir / name)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, record_id: int) -> int:
+        """Remove todos os arquivos em cache de um registro (qualquer hash/formato)."""
+        prefix = f"{record_id}-"
+        removed = 0
+        with self._lock:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.startswith(prefix):
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+                    size = self._entries.pop(entry.name, None)
+                    if size is not None:
+                        self._total_bytes -= size
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,313 @@
+"""
+Serviço de jobs de exportação.
+Executa a geração de planilhas em um ProcessPoolExecutor limitado, fora do
+event loop, com fila de tamanho máximo e limpeza dos arquivos após um TTL.
+
+O estado dos jobs fica em disco (um JSON por job na pasta de saída), não na memória
+do processo: com vários workers do uvicorn, qualquer um deles responde pelo status e
+pelo download, e a fila e o número de gerações simultâneas valem para o servidor
+todo (lock de arquivo no registro e uma vaga por arquivo de lock).
+"""
+
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock entre processos (rodar com um único worker)
+    fcntl = None
+
+
+class ExportQueueFullError(Exception):
+    """Levantada quando a fila de exportação atingiu o limite de jobs pendentes."""
+
+
+# Erro registrado nos jobs em andamento quando um processo do pool morre
+BROKEN_POOL_ERROR = "O processo de exportação foi encerrado inesperadamente (ex.: falta de memória); tente novamente"
+# Erro registrado nos jobs de um worker que foi encerrado antes de concluí-los
+ORPHAN_ERROR = "O servidor que processava a exportação foi encerrado; tente novamente"
+
+ACTIVE_STATUSES = ("pendente", "processando")
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+REGISTRY_LOCK = ".registro.lock"
+
+
+# ---------- estado em disco (usado pelo servidor e pelos processos filhos) ----------
+
+def _read_state(path: Path) -> Optional[Dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(path: Path, state: Dict):
+    """Grava o estado de forma atômica (quem lê nunca vê um JSON pela metade)."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _registry_lock(output_dir: Path) -> Iterator[None]:
+    """Exclusão mútua entre os processos do servidor ao ler-e-gravar o registro de jobs."""
+    with open(output_dir / REGISTRY_LOCK, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _acquire_slot(output_dir: str, slots: int):
+    """
+    Ocupa uma das `slots` vagas de geração do servidor (entre todos os workers) e devolve
+    o arquivo de lock aberto; a vaga é liberada ao fechá-lo (ou se o processo morrer).
+    """
+    if fcntl is None:
+        return None
+    while True:
+        for slot in range(slots):
+            f = open(os.path.join(output_dir, f".vaga-{slot}.lock"), "a+")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        time.sleep(0.1)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _run_export(builder: Callable, args: tuple, output_path: str, state_path: str, slots: int) -> int:
+    """
+    Executado no processo filho: espera uma vaga, gera o arquivo e grava direto em disco.
+    A conclusão é registrada aqui, ainda com a vaga: o status nunca mostra mais jobs
+    processando do que vagas. Erros são registrados pelo servidor (_on_done).
+    """
+    slot = _acquire_slot(os.path.dirname(output_path), slots)
+    try:
+        state = _read_state(Path(state_path))
+        if state is not None and state["status"] == "pendente":
+            state["status"] = "processando"
+            _write_state(Path(state_path), state)
+
+        content = builder(*args)
+        tmp_path = output_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, output_path)
+
+        state = _read_state(Path(state_path))
+        if state is not None:
+            state.update(status="concluido", size=len(content), finished_at=time.time())
+            _write_state(Path(state_path), state)
+        return len(content)
+    finally:
+        if slot is not None:
+            slot.close()
+
+
+class ExportJobManager:
+    """
+    Gerencia jobs de exportação.
+
+    Args:
+        output_dir: Pasta onde os arquivos gerados e o estado dos jobs ficam até expirar
+            (a mesma para todos os workers)
+        max_workers: Gerações simultâneas no servidor (somando todos os workers)
+        max_pending: Máximo de jobs não concluídos no servidor (na fila + em execução)
+        ttl_seconds: Tempo que um job concluído (e seu arquivo) fica disponível
+    """
+
+    def __init__(self, output_dir: Path, max_workers: int = 2, max_pending: int = 8, ttl_seconds: int = 900):
+        self.output_dir = Path(output_dir)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._owned: set = set()    # jobs enfileirados por este processo
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.pool_restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Criado sob demanda; "spawn" evita fork de um processo com threads do servidor
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """
+        Descarta um pool quebrado (um processo morreu: todos os futures dele falham com
+        BrokenProcessPool e ele não aceita mais jobs); o próximo submit cria outro.
+        """
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            self.pool_restarts += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _state_path(self, job_id: str) -> Path:
+        return self.output_dir / f"{job_id}.json"
+
+    def _states(self) -> List[Dict]:
+        states = []
+        for path in self.output_dir.glob("*.json"):
+            state = _read_state(path)
+            if state is not None:
+                states.append(state)
+        return states
+
+    def submit(self, builder: Callable, args: tuple, filename: str, media_type: str) -> Dict:
+        """
+        Enfileira um job. `builder(*args)` deve ser uma função de nível de módulo que retorna bytes.
+        Levanta ExportQueueFullError se já houver `max_pending` jobs em andamento no servidor.
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock, _registry_lock(self.output_dir):
+            pending = sum(1 for state in self._states() if state["status"] in ACTIVE_STATUSES)
+            if pending >= self.max_pending:
+                raise ExportQueueFullError(f"Fila de exportação cheia ({pending} jobs pendentes)")
+
+            job_id = uuid.uuid4().hex
+            output_path = self.output_dir / f"{job_id}_{filename}"
+            job = {
+                "job_id": job_id,
+                "status": "pendente",
+                "filename": filename,
+                "media_type": media_type,
+                "path": str(output_path),
+                "size": None,
+                "error": None,
+                "created_at": time.time(),
+                "finished_at": None,
+                "owner_pid": os.getpid(),
+            }
+            _write_state(self._state_path(job_id), job)
+            self._owned.add(job_id)
+
+        try:
+            # Pool quebrado por um job anterior: descarta e tenta uma vez com um novo
+            for attempt in range(2):
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(
+                        _run_export, builder, args, str(output_path), str(self._state_path(job_id)), self.max_workers
+                    )
+                    break
+                except BrokenProcessPool:
+                    self._discard_pool(pool)
+                    if attempt:
+                        raise
+        except Exception:
+            self._remove(job)
+            raise
+        future.add_done_callback(lambda f, job_id=job_id, pool=pool: self._on_done(job_id, f, pool))
+        return self.describe(job)
+
+    def _on_done(self, job_id: str, future: Future, pool: ProcessPoolExecutor):
+        broken = False
+        updates = {"finished_at": time.time()}
+        try:
+            updates.update(size=future.result(), status="concluido")
+        except BrokenProcessPool:
+            # Todos os jobs em andamento no pool caem aqui, cada um marcado com erro
+            broken = True
+            updates.update(status="erro", error=BROKEN_POOL_ERROR)
+        except BaseException as e:
+            updates.update(status="erro", error=str(e) or e.__class__.__name__)
+
+        with self._lock, _registry_lock(self.output_dir):
+            state = _read_state(self._state_path(job_id))
+            # Removido nesse meio tempo (desligamento) ou já concluído pelo processo filho
+            if state is not None and state["status"] in ACTIVE_STATUSES:
+                state.update(updates)
+                _write_state(self._state_path(job_id), state)
+        if broken:
+            self._discard_pool(pool)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Estado do job, criado por qualquer worker do servidor (None se não existir ou expirou)."""
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        return _read_state(self._state_path(job_id))
+
+    @staticmethod
+    def describe(job: Dict) -> Dict:
+        """Representação pública do job (sem caminho em disco)."""
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "filename": job["filename"],
+            "size": job["size"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+        }
+
+    def _remove(self, job: Dict):
+        for path in (self._state_path(job["job_id"]), Path(job["path"])):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._owned.discard(job["job_id"])
+
+    def cleanup_expired(self) -> int:
+        """
+        Remove jobs concluídos (ou com erro) há mais de `ttl_seconds` e seus arquivos, e marca
+        com erro os jobs em andamento de workers que não existem mais.
+        """
+        if not self.output_dir.exists():
+            return 0
+        now = time.time()
+        # Mesma ordem de locks de submit/_on_done (o flock também bloqueia entre threads)
+        with self._lock, _registry_lock(self.output_dir):
+            expired = []
+            for state in self._states():
+                if state["finished_at"] is not None:
+                    if now - state["finished_at"] > self.ttl_seconds:
+                        expired.append(state)
+                elif fcntl is not None and not _process_alive(state["owner_pid"]):
+                    state.update(status="erro", error=ORPHAN_ERROR, finished_at=now)
+                    _write_state(self._state_path(state["job_id"]), state)
+            for state in expired:
+                self._remove(state)
+        return len(expired)
+
+    def shutdown(self):
+        """Encerra o pool e apaga os jobs deste processo (os jobs não sobrevivem a ele)."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            owned = list(self._owned)
+        for job_id in owned:
+            state = _read_state(self._state_path(job_id))
+            if state is not None:
+                self._remove(state)
@@ -0,0 +1,185 @@
+"""
+Serviço de exportação.
+Responsável pela geração das planilhas Excel a partir dos resultados da análise
+e dos apontamentos salvos no histórico.
+
+As funções aqui são puras (entrada -> bytes) e de nível de módulo, para poderem
+ser executadas em outro processo (ProcessPoolExecutor).
+"""
+
+import csv
+import io
+from typing import Dict, List
+
+import openpyxl
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def build_results_workbook(days: List[Dict]) -> bytes:
+    """
+    Gera a planilha com o resultado da análise (um dia por linha).
+
+    Args:
+        days: Lista de dias no formato retornado pelo frontend/analyze
+
+    Returns:
+        Conteúdo do arquivo .xlsx
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Apontamento de Horas"
+
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+
+    ok_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
+    divergent_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+    ignored_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    # Cabeçalhos (removido "Diferença")
+    headers = ["Data", "Dia", "Tempo Trabalhado", "Valor Redmine", "Tipo", "Status"]
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        cell.border = thin_border
+
+    # Dados
+    for row_idx, day in enumerate(days, 2):
+        ws.cell(row=row_idx, column=1, value=day.get("date", "")).border = thin_border
+        ws.cell(row=row_idx, column=2, value=day.get("day_of_week", "")).border = thin_border
+        ws.cell(row=row_idx, column=3, value=day.get("worked_time", "")).border = thin_border
+        ws.cell(row=row_idx, column=4, value=day.get("redmine_value", "")).border = thin_border
+        ws.cell(row=row_idx, column=5, value=day.get("day_type", "")).border = thin_border
+
+        status_cell = ws.cell(row=row_idx, column=6, value=day.get("status_description", ""))
+        status_cell.border = thin_border
+
+        # Aplicar cor baseada no status
+        status = day.get("status", "")
+        if status == "ok":
+            for col in range(1, 7):
+                ws.cell(row=row_idx, column=col).fill = ok_fill
+        elif status == "divergent":
+            for col in range(1, 7):
+                ws.cell(row=row_idx, column=col).fill = divergent_fill
+        elif status == "ignorado":
+            for col in range(1, 7):
+                ws.cell(row=row_idx, column=col).fill = ignored_fill
+
+    # Ajustar largura das colunas
+    column_widths = [12, 12, 18, 15, 20, 18]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+
+    # Salvar em bytes
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+# ============ EXPORTAÇÃO DE APONTAMENTOS SALVOS ============
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+
+RECORD_HEADERS = ["Data", "Dia", "Intervalos", "Total Horas", "Horas Extras", "Ausências", "Observação"]
+
+
+def _record_rows(record: Dict) -> List[List]:
+    """Uma linha por dia do apontamento salvo (formato DayDetail)."""
+    rows = []
+    for day in record.get("dias", []):
+        intervals = ", ".join(
+            f"{iv.get('entry', '')}-{iv.get('exit', '')}"
+            for iv in day.get("intervals", [])
+            if iv.get("entry") or iv.get("exit")
+        )
+        rows.append([
+            day.get("date", ""),
+            day.get("day_name", ""),
+            intervals,
+            round(day.get("total_hours", 0.0), 2),
+            day.get("overtime") or "00:00",
+            day.get("absence") or "00:00",
+            (day.get("ignore_reason") or "Ignorado") if day.get("is_ignored") else "",
+        ])
+    return rows
+
+
+def build_record_workbook(record: Dict) -> bytes:
+    """
+    Gera a planilha de um apontamento salvo no histórico.
+
+    Args:
+        record: Registro no formato retornado por /api/historico/{id}
+
+    Returns:
+        Conteúdo do arquivo .xlsx
+    """
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Apontamento"
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    ignored_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    # Cabeçalho do registro
+    ws.cell(row=1, column=1, value="Colaborador").font = Font(bold=True)
+    ws.cell(row=1, column=2, value=record.get("colaborador", ""))
+    ws.cell(row=2, column=1, value="Período").font = Font(bold=True)
+    ws.cell(row=2, column=2, value=f"{record.get('periodo_inicio', '')} a {record.get('periodo_fim', '')}")
+    ws.cell(row=3, column=1, value="Total Horas").font = Font(bold=True)
+    ws.cell(row=3, column=2, value=round(record.get("total_horas", 0.0), 2))
+
+    first_row = 5
+    for col, header in enumerate(RECORD_HEADERS, 1):
+        cell = ws.cell(row=first_row, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        cell.border = thin_border
+
+    for row_idx, values in enumerate(_record_rows(record), first_row + 1):
+        for col, value in enumerate(values, 1):
+            cell = ws.cell(row=row_idx, column=col, value=value)
+            cell.border = thin_border
+            if values[-1]:
+                cell.fill = ignored_fill
+
+    column_widths = [12, 12, 30, 12, 14, 12, 28]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = width
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def build_record_csv(record: Dict) -> bytes:
+    """Gera o CSV (separador ';', UTF-8 com BOM para abrir direto no Excel) de um apontamento salvo."""
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=";")
+    writer.writerow(RECORD_HEADERS)
+    for values in _record_rows(record):
+        writer.writerow([f"{v:.2f}".replace(".", ",") if isinstance(v, float) else v for v in values])
+    return output.getvalue().encode("utf-8-sig")
@@ -0,0 +1,256 @@
+"""
+Cache em memória das consultas de histórico (listagens e detalhes).
+
+As entradas são invalidadas com precisão a cada gravação (write-through) e,
+para continuar corretas com vários workers, o cache acompanha o log de
+alterações do banco: `PRAGMA data_version` (barato, sem I/O) indica se outra
+conexão gravou algo; só então o log é lido e aplicado.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# Acima disso, é mais barato limpar o cache do que aplicar alteração por alteração
+MAX_SYNC_CHANGES = 1000
+
+
+# LOWER() do SQLite (sem ICU) só converte A-Z: "JOÃO" vira "joÃo", diferente de "joão"
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def sqlite_lower(text: str) -> str:
+    """Minúsculas exatamente como o LOWER() do SQLite: só letras ASCII."""
+    return text.translate(_ASCII_LOWER)
+
+
+def month_bounds(mes: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Converte o filtro YYYY-MM em faixa ISO (yyyy-mm-01, yyyy-mm-31). None se vazio ou inválido."""
+    if not mes or not mes.strip():
+        return None
+    try:
+        year, month = mes.strip().split("-")
+    except ValueError:
+        return None
+    return f"{year}-{month}-01", f"{year}-{month}-31"
+
+
+def listing_key(colaborador: Optional[str], mes: Optional[str]) -> Tuple[str, Optional[Tuple[str, str]]]:
+    """Chave normalizada de uma listagem (mesmos filtros efetivos => mesma chave)."""
+    nome = sqlite_lower(colaborador.strip()) if colaborador and colaborador.strip() else ""
+    return nome, month_bounds(mes)
+
+
+def _describe_main(conn: sqlite3.Connection, ids: Iterable[int]) -> Dict[int, tuple]:
+    """(colaborador, periodo_inicio_iso, periodo_fim_iso) dos ids existentes, na tabela principal."""
+    ids = list(ids)
+    rows = conn.execute(
+        f"SELECT id, colaborador, periodo_inicio_iso, periodo_fim_iso FROM apontamentos WHERE id IN ({','.join('?' * len(ids))})",
+        ids,
+    )
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def _listing_matches(key: Tuple, colaborador: str, inicio_iso: Optional[str], fim_iso: Optional[str]) -> bool:
+    """Indica se um registro novo pode aparecer na listagem `key` (na dúvida, True)."""
+    nome, bounds = key
+    # % e _ são curingas no LIKE do SQLite: não dá para reproduzir com segurança, invalida
+    if nome and "%" not in nome and "_" not in nome and nome not in sqlite_lower(colaborador):
+        return False
+    if bounds:
+        first, last = bounds
+        in_month = (
+            (inicio_iso is not None and first <= inicio_iso <= last)
+            or (fim_iso is not None and first <= fim_iso <= last)
+        )
+        if not in_month:
+            return False
+    return True
+
+
+class HistoryCache:
+    """
+    Cache LRU limitado de listagens (/api/historico) e detalhes (/api/historico/{id}).
+
+    Args:
+        connect: Função que abre uma conexão com o banco (usada para acompanhar alterações)
+        describe: Função (conexão, ids) -> {id: (colaborador, inicio_iso, fim_iso)} dos registros
+            incluídos por outras conexões (padrão: tabela `apontamentos` do banco principal)
+        max_listings: Máximo de listagens em cache
+        max_details: Máximo de detalhes em cache
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection],
+                 describe: Callable[[sqlite3.Connection, Iterable[int]], Dict[int, tuple]] = _describe_main,
+                 max_listings: int = 256, max_details: int = 1024):
+        self._connect = connect
+        self._describe = describe
+        self.max_listings = max_listings
+        self.max_details = max_details
+        self._lock = threading.Lock()
+        # chave -> (resposta, ids presentes, seq do log no momento do preenchimento)
+        self._listings: "OrderedDict[Tuple, Tuple[Dict, frozenset, int]]" = OrderedDict()
+        self._details: "OrderedDict[int, Dict]" = OrderedDict()
+        self._watch_conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._applied_seq = 0
+        self.metrics = {
+            "listing_hits": 0,
+            "listing_misses": 0,
+            "detail_hits": 0,
+            "detail_misses": 0,
+            "invalidations": 0,
+            "full_clears": 0,
+            "syncs": 0,
+        }
+
+    # ---------- acompanhamento de outras conexões/workers ----------
+
+    def _sync(self):
+        """Aplica as alterações gravadas por outras conexões desde a última verificação."""
+        if self._watch_conn is None:
+            self._watch_conn = self._connect()
+            self._watch_conn.row_factory = sqlite3.Row
+            self._applied_seq = self._watch_conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM apontamentos_alteracoes"
+            ).fetchone()[0]
+            self._data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+            return
+
+        data_version = self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        self.metrics["syncs"] += 1
+
+        # Log podado além do ponto aplicado: alterações perdidas, só resta limpar
+        oldest = self._watch_conn.execute(
+            "SELECT COALESCE(MIN(seq), 1) - 1 FROM apontamentos_alteracoes"
+        ).fetchone()[0]
+        if self._applied_seq < oldest:
+            self._clear()
+            self._applied_seq = self._watch_conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM apontamentos_alteracoes"
+            ).fetchone()[0]
+            return
+
+        changes = self._watch_conn.execute(
+            """
+            SELECT seq, apontamento_id, operacao
+            FROM apontamentos_alteracoes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+            """,
+            (self._applied_seq, MAX_SYNC_CHANGES + 1),
+        ).fetchall()
+
+        if len(changes) > MAX_SYNC_CHANGES:
+            self._clear()
+            self._applied_seq = self._watch_conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM apontamentos_alteracoes"
+            ).fetchone()[0]
+            return
+
+        inserted = [change["apontamento_id"] for change in changes if change["operacao"] == "insert"]
+        records = self._describe(self._watch_conn, inserted) if inserted else {}
+        for change in changes:
+            if change["operacao"] == "insert":
+                # Registro já excluído (não encontrado): a exclusão vem logo adiante no log
+                record = records.get(change["apontamento_id"])
+                if record is not None:
+                    self._apply_insert(change["seq"], *record)
+            else:
+                self._apply_delete(change["seq"], change["apontamento_id"])
+            self._applied_seq = change["seq"]
+
+    def _clear(self):
+        self._listings.clear()
+        self._details.clear()
+        self.metrics["full_clears"] += 1
+
+    def _apply_insert(self, seq: int, colaborador: str, inicio_iso: Optional[str], fim_iso: Optional[str]):
+        for key, (_, _, filled_seq) in list(self._listings.items()):
+            if filled_seq < seq and _listing_matches(key, colaborador, inicio_iso, fim_iso):
+                del self._listings[key]
+                self.metrics["invalidations"] += 1
+
+    def _apply_delete(self, seq: int, record_id: int):
+        if self._details.pop(record_id, None) is not None:
+            self.metrics["invalidations"] += 1
+        for key, (_, ids, filled_seq) in list(self._listings.items()):
+            if filled_seq < seq and record_id in ids:
+                del self._listings[key]
+                self.metrics["invalidations"] += 1
+
+    # ---------- leitura ----------
+
+    def get_listing(self, key: Tuple) -> Optional[Dict]:
+        with self._lock:
+            self._sync()
+            entry = self._listings.get(key)
+            if entry is None:
+                self.metrics["listing_misses"] += 1
+                return None
+            self._listings.move_to_end(key)
+            self.metrics["listing_hits"] += 1
+            return entry[0]
+
+    def put_listing(self, key: Tuple, response: Dict, filled_seq: int):
+        """`filled_seq` é o cursor lido ANTES da consulta (conservador)."""
+        ids = frozenset(rec["id"] for rec in response["registros"])
+        with self._lock:
+            self._listings[key] = (response, ids, filled_seq)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_listings:
+                self._listings.popitem(last=False)
+
+    def get_detail(self, record_id: int) -> Optional[Dict]:
+        with self._lock:
+            self._sync()
+            record = self._details.get(record_id)
+            if record is None:
+                self.metrics["detail_misses"] += 1
+                return None
+            self._details.move_to_end(record_id)
+            self.metrics["detail_hits"] += 1
+            return record
+
+    def put_detail(self, record_id: int, record: Dict):
+        with self._lock:
+            self._details[record_id] = record
+            self._details.move_to_end(record_id)
+            while len(self._details) > self.max_details:
+                self._details.popitem(last=False)
+
+    # ---------- gravação (write-through) ----------
+
+    def on_insert(self, seq: int, colaborador: str, inicio_iso: Optional[str], fim_iso: Optional[str]):
+        with self._lock:
+            self._apply_insert(seq, colaborador, inicio_iso, fim_iso)
+
+    def on_delete(self, seq: int, record_id: int):
+        with self._lock:
+            self._apply_delete(seq, record_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            listing_total = self.metrics["listing_hits"] + self.metrics["listing_misses"]
+            detail_total = self.metrics["detail_hits"] + self.metrics["detail_misses"]
+            return {
+                **self.metrics,
+                "listings": len(self._listings),
+                "details": len(self._details),
+                "listing_hit_rate": round(self.metrics["listing_hits"] / listing_total, 4) if listing_total else 0.0,
+                "detail_hit_rate": round(self.metrics["detail_hits"] / detail_total, 4) if detail_total else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            # Sem a conexão não há como acompanhar alterações: ao reabrir, o cache recomeça vazio
+            self._listings.clear()
+            self._details.clear()
+            if self._watch_conn is not None:
+                self._watch_conn.close()
+                self._watch_conn = None
@@ -4,7 +4,7 @@ Responsável pela detecção de feriados fixos, variáveis e finais de semana.
 """
 
 from datetime import date, datetime, timedelta
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Iterator
 import holidays
 
 
@@ -117,16 +117,21 @@ def classify_date(date_str: str, holidays_dict: Dict[str, str],
     }
 
 
-def generate_date_range(start_date: date, end_date: date) -> List[str]:
+def iter_date_range(start_date: date, end_date: date) -> Iterator[date]:
     """
-    Gera lista de datas entre start_date e end_date.
+    Percorre as datas entre start_date e end_date sem materializar a lista.
     """
-    dates = []
     current = start_date
     while current <= end_date:
-        dates.append(current.strftime("%d/%m/%Y"))
+        yield current
         current += timedelta(days=1)
-    return dates
+
+
+def generate_date_range(start_date: date, end_date: date) -> List[str]:
+    """
+    Gera lista de datas entre start_date e end_date.
+    """
+    return [current.strftime("%d/%m/%Y") for current in iter_date_range(start_date, end_date)]
 
 
 def get_states_list() -> List[Dict[str, str]]:
@@ -3,8 +3,9 @@ Serviço de processamento de horas.
 Responsável pela conversão de formatos e cálculos.
 """
 
+from bisect import bisect_right
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 
 
 def time_to_decimal(time_str: str) -> float:
@@ -145,7 +146,86 @@ def determine_status(difference_minutes: int, tolerance: int = 2) -> dict:
         }
 
 
-def process_day(date_str: str, worked_time: str, day_type: Optional[str] = None) -> dict:
+def conformity_sweep(worked_decimals: List[float], expected_hours: Iterable[float],
+                     tolerances: Iterable[int]) -> List[Dict]:
+    """
+    Simula a conformidade dos dias úteis para cada combinação de horas esperadas e tolerância.
+
+    Para cada valor de horas esperadas, as diferenças absolutas em minutos (mesmo cálculo de
+    calculate_difference) são ordenadas uma vez; a quantidade de dias que conferem com cada
+    tolerância sai então de uma busca binária (mesma regra de determine_status: |dif| <= tol).
+
+    Args:
+        worked_decimals: Horas trabalhadas (decimal) de cada dia útil
+        expected_hours: Valores de horas esperadas a simular
+        tolerances: Tolerâncias em minutos a simular
+
+    Returns:
+        Lista com um item por combinação (expected_hours, tolerance)
+    """
+    total = len(worked_decimals)
+    tolerances = sorted(set(tolerances))
+    grid = []
+    for expected in sorted(set(expected_hours)):
+        differences = sorted(abs(round((worked - expected) * 60)) for worked in worked_decimals)
+        for tolerance in tolerances:
+            days_ok = bisect_right(differences, tolerance)
+            grid.append({
+                "expected_hours": expected,
+                "tolerance": tolerance,
+                "days_ok": days_ok,
+                "days_divergent": total - days_ok,
+                "conformity_percentage": round(days_ok / total * 100, 2) if total else 0.0,
+            })
+    return grid
+
+
+class DayRecord:
+    """
+    Resultado do processamento de um dia.
+    Usa __slots__ para manter o custo por dia baixo em períodos longos (análise em streaming).
+    """
+
+    __slots__ = (
+        "date", "worked_time", "redmine_value", "difference", "status", "status_icon",
+        "status_description", "css_class", "is_ignored", "day_type", "manual_status", "day_of_week",
+    )
+
+    def __init__(self, date_str: str, worked_time: str, day_type: Optional[str] = None):
+        self.date = date_str
+        self.worked_time = worked_time
+        self.redmine_value = "----"
+        self.difference = "----"
+        self.status = None
+        self.status_icon = ""
+        self.status_description = ""
+        self.css_class = ""
+        self.is_ignored = False
+        self.day_type = day_type
+        self.manual_status = None  # Permite marcação manual
+        self.day_of_week = None
+
+    def to_dict(self) -> dict:
+        """Mesmo formato de dicionário retornado historicamente por process_day."""
+        result = {
+            "date": self.date,
+            "worked_time": self.worked_time,
+            "redmine_value": self.redmine_value,
+            "difference": self.difference,
+            "status": self.status,
+            "status_icon": self.status_icon,
+            "status_description": self.status_description,
+            "css_class": self.css_class,
+            "is_ignored": self.is_ignored,
+            "day_type": self.day_type,
+            "manual_status": self.manual_status,
+        }
+        if self.day_of_week is not None:
+            result["day_of_week"] = self.day_of_week
+        return result
+
+
+def process_day_record(date_str: str, worked_time: str, day_type: Optional[str] = None) -> DayRecord:
     """
     Processa um dia completo.
     
@@ -155,41 +235,44 @@ def process_day(date_str: str, worked_time: str, day_type: Optional[str] = None)
         day_type: Tipo do dia (feriado, final_semana, etc.) ou None para dia útil
     
     Returns:
-        dict completo com todas as informações do dia
+        DayRecord com todas as informações do dia
     """
-    result = {
-        "date": date_str,
-        "worked_time": worked_time,
-        "redmine_value": "----",
-        "difference": "----",
-        "status": None,
-        "status_icon": "",
-        "status_description": "",
-        "css_class": "",
-        "is_ignored": False,
-        "day_type": day_type,
-        "manual_status": None  # Permite marcação manual
-    }
+    record = DayRecord(date_str, worked_time, day_type)
     
     if day_type:
         # Dia ignorado (feriado, final de semana, etc.)
-        result["is_ignored"] = True
-        result["worked_time"] = "----"
-        result["difference"] = day_type
-        result["status"] = "ignorado"
-        result["status_icon"] = "📅"
-        result["status_description"] = f"Ignorado ({day_type})"
-        result["css_class"] = "status-ignored"
+        record.is_ignored = True
+        record.worked_time = "----"
+        record.difference = day_type
+        record.status = "ignorado"
+        record.status_icon = "📅"
+        record.status_description = f"Ignorado ({day_type})"
+        record.css_class = "status-ignored"
     else:
         # Dia útil - calcular
         calc = calculate_difference(worked_time)
         status_info = determine_status(calc["difference_minutes"])
         
-        result["redmine_value"] = calc["redmine_display"]
-        result["difference"] = calc["difference_str"]
-        result["status"] = status_info["status"]
-        result["status_icon"] = status_info["icon"]
-        result["status_description"] = status_info["description"]
-        result["css_class"] = status_info["css_class"]
-    
-    return result
+        record.redmine_value = calc["redmine_display"]
+        record.difference = calc["difference_str"]
+        record.status = status_info["status"]
+        record.status_icon = status_info["icon"]
+        record.status_description = status_info["description"]
+        record.css_class = status_info["css_class"]
+    
+    return record
+
+
+def process_day(date_str: str, worked_time: str, day_type: Optional[str] = None) -> dict:
+    """
+    Processa um dia completo.
+    
+    Args:
+        date_str: Data no formato dd/mm/yyyy
+        worked_time: Tempo trabalhado no formato HH:MM
+        day_type: Tipo do dia (feriado, final_semana, etc.) ou None para dia útil
+    
+    Returns:
+        dict completo com todas as informações do dia
+    """
+    return process_day_record(date_str, worked_time, day_type).to_dict()
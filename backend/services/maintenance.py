@@ -0,0 +1,348 @@
+"""
+Manutenção periódica do SQLite (banco principal e partições anuais do histórico).
+
+Tarefas: PRAGMA optimize, ANALYZE (amostrado por analysis_limit), checkpoint do WAL,
+incremental_vacuum e quick_check. Rodam em segundo plano, de preferência quando o
+servidor está ocioso, uma tarefa por vez e com orçamento de tempo: a conexão de
+manutenção não espera por locks (timeout=0) e um progress handler interrompe a
+instrução que passar do orçamento, então uma requisição nunca fica presa atrás dela.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.partitions import GRAVAVEL, HistoryPartitions
+
+logger = logging.getLogger("apontamentos.manutencao")
+LOG_FORMAT = "%(levelname)s:     %(message)s"   # mesmo formato das linhas do uvicorn
+
+# Linhas amostradas por índice no ANALYZE (0 = tabela inteira)
+ANALYSIS_LIMIT = 400
+# Páginas liberadas por execução de incremental_vacuum
+VACUUM_PAGES_PER_RUN = 64
+# Páginas livres a partir das quais vale rodar incremental_vacuum
+VACUUM_MIN_FREE_PAGES = 64
+# Instruções da VM entre verificações do orçamento de tempo
+PROGRESS_STEPS = 1000
+# Espera antes de repetir uma tarefa que falhou (sem isso ela seria escolhida a cada ciclo)
+RETRY_SECONDS = 60
+
+
+def configure_logging():
+    """
+    Garante que as linhas da manutenção apareçam no console do servidor. O uvicorn só
+    configura os próprios loggers: sem isto, "apontamentos.manutencao" herdaria o root
+    (nível WARNING, sem handler) e os logger.info seriam descartados. Respeita o que já
+    tiver sido configurado (handler no root ou nível próprio definido por quem embarca o app).
+    """
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+
+
+class MaintenanceTask:
+    """Uma tarefa de manutenção com intervalo próprio e métricas de execução."""
+
+    def __init__(self, name: str, interval: float, action: Callable, writes: bool):
+        self.name = name
+        self.interval = interval
+        self.action = action          # action(conn, schema) -> detalhe (str)
+        self.writes = writes          # precisa de partição gravável
+        self.created = time.monotonic()
+        self.last_run: Optional[float] = None
+        self.retry_at: Optional[float] = None   # após uma falha, só volta a rodar a partir daqui
+        self.cursor = 0               # próxima partição a tratar (rodízio)
+        self.runs = 0
+        self.completed = 0
+        self.interrupted = 0
+        self.busy = 0
+        self.errors = 0
+        self.last_result: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_run_at: Optional[str] = None
+        self.last_entry: Optional[Dict] = None   # última execução completa (com o detalhe por partição)
+
+    def due(self, now: float) -> bool:
+        if self.retry_at is not None and now < self.retry_at:
+            return False
+        return self.last_run is None or now - self.last_run >= self.interval
+
+    def overdue(self, now: float) -> bool:
+        """Atrasada há mais de um intervalo: roda mesmo com tráfego (continua limitada pelo orçamento)."""
+        return now - (self.last_run or self.created) >= 2 * self.interval
+
+    def stats(self) -> Dict:
+        return {
+            "interval_seconds": self.interval,
+            "runs": self.runs,
+            "completed": self.completed,
+            "interrupted": self.interrupted,
+            "busy": self.busy,
+            "errors": self.errors,
+            "last_run_at": self.last_run_at,
+            "last_result": self.last_result,
+            "last_duration_ms": self.last_duration_ms,
+            "last_run": self.last_entry,
+        }
+
+
+# ---------- ações (uma partição/esquema por chamada) ----------
+
+def _optimize(conn: sqlite3.Connection, schema: str) -> str:
+    conn.execute(f"PRAGMA {schema}.optimize")
+    return "ok"
+
+
+def _analyze(conn: sqlite3.Connection, schema: str) -> str:
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute(f"ANALYZE {schema}")
+    return "ok"
+
+
+def _checkpoint(conn: sqlite3.Connection, schema: str) -> str:
+    if conn.execute(f"PRAGMA {schema}.journal_mode").fetchone()[0].lower() != "wal":
+        return "sem WAL"
+    # PASSIVE: não espera leitores nem escritores, copia o que for possível
+    busy, log_frames, checkpointed = conn.execute(f"PRAGMA {schema}.wal_checkpoint(PASSIVE)").fetchone()
+    return f"{checkpointed}/{log_frames} frames"
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, schema: str) -> str:
+    if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+        return "auto_vacuum não incremental"
+    free_pages = conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0]
+    if free_pages < VACUUM_MIN_FREE_PAGES:
+        return f"{free_pages} páginas livres"
+    # executescript roda a instrução até o fim; execute() libera só uma página por passo
+    conn.executescript(f"PRAGMA {schema}.incremental_vacuum({VACUUM_PAGES_PER_RUN})")
+    return f"{free_pages - conn.execute(f'PRAGMA {schema}.freelist_count').fetchone()[0]} páginas liberadas"
+
+
+def _quick_check(conn: sqlite3.Connection, schema: str) -> str:
+    problems = [row[0] for row in conn.execute(f"PRAGMA {schema}.quick_check(10)")]
+    if problems != ["ok"]:
+        logger.error("quick_check falhou em %s: %s", schema, "; ".join(problems))
+        return "falha: " + "; ".join(problems)
+    return "ok"
+
+
+class ActivityMiddleware:
+    """
+    Middleware ASGI que informa ao agendador o início e o fim de cada requisição HTTP.
+    O fim é o último pedaço do corpo (more_body=False), não o envio dos cabeçalhos:
+    respostas em streaming (NDJSON, downloads) contam como tráfego até terminarem.
+    """
+
+    def __init__(self, app, scheduler: "MaintenanceScheduler"):
+        self.app = app
+        self.scheduler = scheduler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if not finished:
+                finished = True
+                self.scheduler.request_finished()
+
+        async def send_tracking(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        self.scheduler.request_started()
+        try:
+            await self.app(scope, receive, send_tracking)
+        finally:
+            # Erro ou cliente desconectado antes do fim do corpo
+            finish()
+
+
+class MaintenanceScheduler:
+    """
+    Agendador da manutenção do banco.
+
+    Args:
+        connect: Abre a conexão de manutenção (deve usar timeout=0 para nunca esperar por locks)
+        partitions: Partições anuais do histórico (tratadas junto com o banco principal)
+        budget_ms: Tempo máximo de cada instrução que grava (optimize, ANALYZE, vacuum, checkpoint)
+        check_budget_ms: Tempo máximo do quick_check (só leitura: no modo WAL não bloqueia gravações)
+        idle_seconds: Tempo sem requisições para considerar o servidor ocioso
+        tick_seconds: Intervalo entre verificações do agendador
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], partitions: HistoryPartitions,
+                 budget_ms: float = 5.0, check_budget_ms: float = 250.0,
+                 idle_seconds: float = 2.0, tick_seconds: float = 5.0):
+        self._connect = connect
+        self._partitions = partitions
+        self.budget_ms = budget_ms
+        self.check_budget_ms = check_budget_ms
+        self.idle_seconds = idle_seconds
+        self.tick_seconds = tick_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._in_flight = 0
+        self._last_request = time.monotonic()
+        self.skipped_busy_server = 0
+        self.history = deque(maxlen=50)
+        self.tasks = [
+            MaintenanceTask("checkpoint", 60, _checkpoint, writes=True),
+            MaintenanceTask("incremental_vacuum", 600, _incremental_vacuum, writes=True),
+            MaintenanceTask("optimize", 3600, _optimize, writes=True),
+            MaintenanceTask("analyze", 6 * 3600, _analyze, writes=True),
+            MaintenanceTask("quick_check", 24 * 3600, _quick_check, writes=False),
+        ]
+
+    # ---------- acompanhamento do tráfego ----------
+
+    def request_started(self):
+        self._in_flight += 1
+        self._last_request = time.monotonic()
+
+    def request_finished(self):
+        self._in_flight -= 1
+        self._last_request = time.monotonic()
+
+    def is_idle(self) -> bool:
+        return self._in_flight == 0 and time.monotonic() - self._last_request >= self.idle_seconds
+
+    # ---------- execução ----------
+
+    def _targets(self, conn: sqlite3.Connection, writes: bool) -> List[Tuple[int, int]]:
+        """(ano, estado) do banco principal e das partições; só as graváveis para tarefas que gravam."""
+        return [
+            (p.ano, p.estado) for p in sorted(self._partitions.partitions(conn), key=lambda p: p.ano)
+            if not writes or p.estado == GRAVAVEL
+        ]
+
+    def next_task(self, now: float) -> Optional[MaintenanceTask]:
+        """Tarefa vencida há mais tempo; com o servidor ocupado, só as muito atrasadas."""
+        idle = self.is_idle()
+        candidates = [t for t in self.tasks if t.due(now) and (idle or t.overdue(now))]
+        if not candidates:
+            if any(t.due(now) for t in self.tasks):
+                self.skipped_busy_server += 1
+            return None
+        return min(candidates, key=lambda t: t.last_run or 0)
+
+    def run_task(self, task: MaintenanceTask) -> str:
+        """
+        Executa a tarefa nas partições, em rodízio, até acabar o orçamento. Síncrono (rodar
+        fora do event loop). Se não der tempo de passar por todas, a tarefa continua vencida
+        e a próxima execução segue de onde esta parou; o intervalo só conta ao fim do ciclo.
+        """
+        if self._conn is None:
+            self._conn = self._connect()
+        conn = self._conn
+        budget = (self.check_budget_ms if task.name == "quick_check" else self.budget_ms) / 1000
+        # Só as instruções da tarefa têm orçamento (não a leitura do catálogo, attach e detach)
+        deadline = float("inf")
+
+        def over_budget():
+            return 1 if time.perf_counter() > deadline else 0
+
+        started = time.perf_counter()
+        targets = []
+        done = []
+        result = "ok"
+        failed = False
+        try:
+            targets = self._targets(conn, task.writes)
+            conn.set_progress_handler(over_budget, PROGRESS_STEPS)
+            if task.cursor >= len(targets):
+                task.cursor = 0
+            while task.cursor < len(targets):
+                # Orçamento por instrução e também pelo total da execução
+                if done and time.perf_counter() - started > budget:
+                    result = "parcial"
+                    break
+                ano, estado = targets[task.cursor]
+                try:
+                    schema = self._partitions.attach(conn, ano, estado)
+                    deadline = time.perf_counter() + budget
+                    try:
+                        done.append(f"{ano or 'principal'}: {task.action(conn, schema)}")
+                    finally:
+                        deadline = float("inf")
+                        self._partitions.detach(conn, ano)
+                except sqlite3.OperationalError as e:
+                    message = str(e).lower()
+                    if "locked" in message or "busy" in message:
+                        # Banco em uso: tenta a mesma partição na próxima execução
+                        task.busy += 1
+                        result = "ocupado"
+                        break
+                    if "interrupted" not in message:
+                        raise
+                    task.interrupted += 1
+                    result = "interrompido"
+                    done.append(f"{ano or 'principal'}: interrompido")
+                task.cursor += 1
+        except Exception as e:
+            # O ciclo não conta como concluído: a mesma partição é repetida depois de RETRY_SECONDS
+            failed = True
+            task.errors += 1
+            task.retry_at = time.monotonic() + RETRY_SECONDS
+            result = f"erro: {e}"
+            logger.exception("Manutenção %s falhou", task.name)
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        if not failed and task.cursor >= len(targets):
+            task.cursor = 0
+            task.completed += 1
+            task.last_run = time.monotonic()
+            task.retry_at = None
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        task.runs += 1
+        task.last_run_at = datetime.now().isoformat(timespec="seconds")
+        task.last_result = result
+        task.last_duration_ms = duration_ms
+        task.last_entry = {
+            "task": task.name,
+            "at": task.last_run_at,
+            "result": result,
+            "duration_ms": duration_ms,
+            "detail": done,
+        }
+        self.history.append(task.last_entry)
+        logger.info("Manutenção %s: %s em %.2f ms (%s)", task.name, result, duration_ms, ", ".join(done))
+        return result
+
+    async def run_forever(self):
+        """Laço do agendador (cancelar no desligamento)."""
+        configure_logging()
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            task = self.next_task(time.monotonic())
+            if task is not None:
+                await asyncio.to_thread(self.run_task, task)
+
+    def stats(self) -> Dict:
+        return {
+            "idle": self.is_idle(),
+            "in_flight": self._in_flight,
+            "skipped_busy_server": self.skipped_busy_server,
+            "budget_ms": self.budget_ms,
+            "tasks": {task.name: task.stats() for task in self.tasks},
+            "recent_runs": list(self.history)[-10:],
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,447 @@
+"""
+Particionamento do histórico por ano em arquivos SQLite anexados (ATTACH).
+
+Cada ano (pelo início do período) fica em `<banco>_<ano>.db`, com a mesma tabela
+`apontamentos`. O banco principal guarda o que é global: o índice id -> ano
+(ids únicos entre partições), o catálogo das partições, o log de alterações e os
+registros sem data válida (partição 0, a própria tabela `apontamentos` do principal).
+
+O catálogo guarda, por partição, o maior id e a maior data de fim gravados: com
+isso as consultas por período e a listagem dos mais recentes abrem só as partições
+que podem ter resultado. O principal guarda também os nomes distintos dos colaboradores
+(normalizados com LOWER), para a busca por trecho do nome não percorrer os registros. Partições antigas podem ser congeladas (somente leitura ou
+imutáveis); gravações e exclusões nelas são recusadas.
+"""
+
+import os
+import sqlite3
+import stat
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+# Partição dos registros sem data de início válida (tabela do banco principal)
+SEM_DATA = 0
+
+# Estados de uma partição no catálogo
+GRAVAVEL = 0
+SOMENTE_LEITURA = 1   # anexada com mode=ro
+IMUTAVEL = 2          # anexada com immutable=1: sem locks nem verificação de alterações
+
+Partition = namedtuple("Partition", "ano max_id max_fim_iso estado")
+
+_PARTITION_TABLE = """
+    CREATE TABLE IF NOT EXISTS {schema}.apontamentos (
+        id INTEGER PRIMARY KEY,
+        colaborador TEXT NOT NULL,
+        periodo_inicio TEXT NOT NULL,
+        periodo_fim TEXT NOT NULL,
+        total_horas REAL DEFAULT 0,
+        criado_em TEXT NOT NULL,
+        dados_json TEXT NOT NULL,
+        periodo_inicio_iso TEXT,
+        periodo_fim_iso TEXT
+    )
+"""
+
+_PARTITION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_apontamentos_colaborador ON apontamentos(LOWER(colaborador))",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_apontamentos_inicio ON apontamentos(periodo_inicio_iso)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_apontamentos_fim ON apontamentos(periodo_fim_iso)",
+]
+
+
+class PartitionFrozenError(Exception):
+    """Gravação ou exclusão em uma partição congelada."""
+
+    def __init__(self, ano: int):
+        super().__init__(f"O histórico de {ano} está congelado (somente leitura)")
+        self.ano = ano
+
+
+def year_of(iso_date: Optional[str]) -> int:
+    """Ano da partição de um registro (pela data ISO de início); SEM_DATA se inválida."""
+    if iso_date and len(iso_date) >= 4 and iso_date[:4].isdigit() and int(iso_date[:4]) > 0:
+        return int(iso_date[:4])
+    return SEM_DATA
+
+
+class HistoryPartitions:
+    """
+    Roteamento das partições anuais do histórico.
+
+    Args:
+        main_path: Caminho do banco principal (as partições ficam na mesma pasta)
+    """
+
+    def __init__(self, main_path: Path):
+        self.main_path = Path(main_path)
+
+    def partition_path(self, ano: int) -> Path:
+        return self.main_path.with_name(f"{self.main_path.stem}_{ano}{self.main_path.suffix}")
+
+    @staticmethod
+    def schema(ano: int) -> str:
+        return "main" if ano == SEM_DATA else f"p{ano}"
+
+    # ---------- esquema ----------
+
+    def init(self, conn: sqlite3.Connection):
+        """Cria o índice de ids e o catálogo no banco principal e move para as partições
+        os registros da tabela principal que têm data (bancos anteriores ao particionamento)."""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS apontamentos_ids (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ano INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_apontamentos_ids_ano ON apontamentos_ids(ano)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS apontamentos_particoes (
+                ano INTEGER PRIMARY KEY,
+                max_id INTEGER NOT NULL DEFAULT 0,
+                max_fim_iso TEXT,
+                estado INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO apontamentos_particoes (ano) VALUES (?)", (SEM_DATA,))
+        nomes_existentes = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'apontamentos_colaboradores'"
+        ).fetchone() is not None
+        # Nomes de quem tem (ou teve) registros; nunca são removidos (um nome sem registros só
+        # custa uma busca vazia no índice)
+        conn.execute("CREATE TABLE IF NOT EXISTS apontamentos_colaboradores (nome TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.commit()
+        self._migrate(conn)
+        if not nomes_existentes:
+            self.rebuild_names(conn)
+
+    def _migrate(self, conn: sqlite3.Connection):
+        # Registros antigos ainda sem entrada no índice (ids preservados)
+        conn.execute("""
+            INSERT INTO apontamentos_ids (id, ano)
+            SELECT id, 0 FROM apontamentos WHERE id NOT IN (SELECT id FROM apontamentos_ids)
+        """)
+        # Ids já usados pela tabela antiga (inclusive excluídos) nunca são reaproveitados
+        conn.execute("""
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'apontamentos_ids', 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'apontamentos_ids')
+        """)
+        conn.execute("""
+            UPDATE sqlite_sequence
+            SET seq = MAX(seq, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'apontamentos'), 0))
+            WHERE name = 'apontamentos_ids'
+        """)
+        conn.commit()
+
+        anos = [
+            year_of(row[0]) for row in conn.execute(
+                "SELECT DISTINCT substr(periodo_inicio_iso, 1, 4) FROM apontamentos WHERE periodo_inicio_iso >= '0001'"
+            )
+        ]
+        for ano in sorted(a for a in set(anos) if a != SEM_DATA):
+            schema = self.ensure(conn, ano)
+            # Cópia e remoção na mesma transação; INSERT OR IGNORE torna a migração retomável
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {schema}.apontamentos
+                SELECT * FROM main.apontamentos
+                WHERE periodo_inicio_iso >= ? AND periodo_inicio_iso < ?
+            """, (f"{ano:04d}", f"{ano + 1:04d}"))
+            conn.execute("""
+                UPDATE apontamentos_ids SET ano = ?
+                WHERE id IN (SELECT id FROM main.apontamentos WHERE periodo_inicio_iso >= ? AND periodo_inicio_iso < ?)
+            """, (ano, f"{ano:04d}", f"{ano + 1:04d}"))
+            conn.execute(
+                "DELETE FROM main.apontamentos WHERE periodo_inicio_iso >= ? AND periodo_inicio_iso < ?",
+                (f"{ano:04d}", f"{ano + 1:04d}"),
+            )
+            self.refresh_bounds(conn, ano)
+            conn.commit()
+        self.refresh_bounds(conn, SEM_DATA)
+        conn.commit()
+
+    def reconcile(self, conn: sqlite3.Connection, log_removed: Callable[[sqlite3.Connection, int], None]) -> int:
+        """
+        Desfaz gravações pela metade deixadas por uma queda durante o COMMIT. No modo WAL o
+        commit de uma transação que grava no banco principal (índice de ids, catálogo, log) e
+        numa partição anexada só é atômico em cada arquivo: pode sobrar um registro na
+        partição sem entrada no índice ou uma entrada no índice sem registro.
+
+        Um registro só existe se estiver nos dois; o que estiver em só um é removido (desfaz
+        uma inclusão incompleta, completa uma exclusão incompleta), com `log_removed` chamado
+        na mesma transação para cada id. Também recalcula o catálogo de cada partição.
+        Partições congeladas são ignoradas (não aceitam gravação). Retorna o total removido.
+        """
+        removed = 0
+        for partition in self.partitions(conn):
+            if partition.estado != GRAVAVEL:
+                continue
+            conn.commit()
+            schema = self.attach(conn, partition.ano, partition.estado)
+            # Espera gravações em andamento de outros workers (inclusive o commit nos vários arquivos)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                sem_indice = [row[0] for row in conn.execute(f"""
+                    SELECT id FROM {schema}.apontamentos p
+                    WHERE NOT EXISTS (SELECT 1 FROM apontamentos_ids i WHERE i.id = p.id AND i.ano = ?)
+                """, (partition.ano,))]
+                sem_registro = [row[0] for row in conn.execute(f"""
+                    SELECT id FROM apontamentos_ids i
+                    WHERE ano = ? AND NOT EXISTS (SELECT 1 FROM {schema}.apontamentos p WHERE p.id = i.id)
+                """, (partition.ano,))]
+                for record_id in sem_indice:
+                    conn.execute(f"DELETE FROM {schema}.apontamentos WHERE id = ?", (record_id,))
+                for record_id in sem_registro:
+                    conn.execute("DELETE FROM apontamentos_ids WHERE id = ?", (record_id,))
+                for record_id in sorted(set(sem_indice) | set(sem_registro)):
+                    log_removed(conn, record_id)
+                    removed += 1
+                self.refresh_bounds(conn, partition.ano)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return removed
+
+    def rebuild_names(self, conn: sqlite3.Connection):
+        """Preenche a tabela de nomes a partir de todas as partições (bancos anteriores a ela)."""
+        for partition in self.partitions(conn):
+            schema = self.attach(conn, partition.ano, partition.estado)
+            try:
+                # Lê só o índice LOWER(colaborador) de cada partição
+                conn.execute(f"""
+                    INSERT OR IGNORE INTO main.apontamentos_colaboradores (nome)
+                    SELECT DISTINCT LOWER(colaborador) FROM {schema}.apontamentos
+                """)
+                conn.commit()
+            finally:
+                self.detach(conn, partition.ano)
+
+    def refresh_bounds(self, conn: sqlite3.Connection, ano: int):
+        """Recalcula max_id e max_fim_iso de uma partição a partir dos dados (partição anexada)."""
+        schema = self.schema(ano)
+        conn.execute(f"""
+            UPDATE apontamentos_particoes SET
+                max_id = (SELECT COALESCE(MAX(id), 0) FROM {schema}.apontamentos),
+                max_fim_iso = (SELECT MAX(periodo_fim_iso) FROM {schema}.apontamentos)
+            WHERE ano = ?
+        """, (ano,))
+
+    # ---------- anexação ----------
+
+    @staticmethod
+    def attach_limit(conn: sqlite3.Connection) -> int:
+        """Máximo de bancos anexados a uma conexão (SQLITE_LIMIT_ATTACHED)."""
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, "getlimit") else 10
+
+    def attach(self, conn: sqlite3.Connection, ano: int, estado: Optional[int] = None,
+               keep: Iterable[str] = ()) -> str:
+        """
+        Anexa a partição à conexão (se ainda não estiver) e retorna o nome do esquema.
+        Fora de transação: ao atingir o limite de bancos anexados, desanexa outra partição
+        (nunca uma das listadas em `keep`).
+        """
+        schema = self.schema(ano)
+        if ano == SEM_DATA:
+            return schema
+        attached = self._attached(conn)
+        if schema in attached:
+            return schema
+
+        if len(attached) >= self.attach_limit(conn):
+            evictable = [name for name in attached if name not in set(keep)]
+            if not evictable:
+                raise sqlite3.OperationalError("Limite de bancos anexados atingido")
+            conn.execute(f"DETACH DATABASE {evictable[0]}")
+
+        if estado is None:
+            row = conn.execute("SELECT estado FROM apontamentos_particoes WHERE ano = ?", (ano,)).fetchone()
+            estado = row[0] if row else GRAVAVEL
+        uri = self.partition_path(ano).resolve().as_uri()
+        if estado == IMUTAVEL:
+            uri += "?immutable=1"
+        elif estado == SOMENTE_LEITURA:
+            uri += "?mode=ro"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (uri,))
+        return schema
+
+    def attach_free(self, conn: sqlite3.Connection, partitions: Iterable[Partition]):
+        """Anexa as partições informadas que couberem na conexão, sem desanexar nenhuma."""
+        for partition in partitions:
+            if len(self._attached(conn)) >= self.attach_limit(conn):
+                break
+            self.attach(conn, partition.ano, partition.estado)
+
+    @staticmethod
+    def _attached(conn: sqlite3.Connection) -> List[str]:
+        return [row[1] for row in conn.execute("PRAGMA database_list") if row[1] not in ("main", "temp")]
+
+    def unattached(self, conn: sqlite3.Connection, partitions: Iterable[Partition]) -> List[int]:
+        """Anos das partições informadas que ainda não estão anexadas à conexão."""
+        attached = set(self._attached(conn))
+        return [p.ano for p in partitions if p.ano != SEM_DATA and self.schema(p.ano) not in attached]
+
+    def detach(self, conn: sqlite3.Connection, ano: int):
+        """Desanexa a partição (conexões longas não devem manter arquivos abertos: impediria congelá-los)."""
+        schema = self.schema(ano)
+        if ano != SEM_DATA and schema in self._attached(conn):
+            conn.execute(f"DETACH DATABASE {schema}")
+
+    def ensure(self, conn: sqlite3.Connection, ano: int) -> str:
+        """Garante que a partição existe (arquivo, tabela, índices e catálogo) e está anexada."""
+        if ano == SEM_DATA:
+            return self.schema(ano)
+        row = conn.execute("SELECT estado FROM apontamentos_particoes WHERE ano = ?", (ano,)).fetchone()
+        if row is not None and row[0] != GRAVAVEL:
+            raise PartitionFrozenError(ano)
+        schema = self.attach(conn, ano, GRAVAVEL)
+        if row is None:
+            # Antes da primeira tabela: auto_vacuum só vale para arquivos novos
+            conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+            conn.execute(f"PRAGMA {schema}.journal_mode = WAL")
+            conn.execute(_PARTITION_TABLE.format(schema=schema))
+            for ddl in _PARTITION_INDEXES:
+                conn.execute(ddl.format(schema=schema))
+            conn.execute("INSERT OR IGNORE INTO apontamentos_particoes (ano) VALUES (?)", (ano,))
+            conn.commit()
+        return schema
+
+    # ---------- catálogo e poda ----------
+
+    def partitions(self, conn: sqlite3.Connection) -> List[Partition]:
+        """Todas as partições, das que têm os ids mais recentes para as mais antigas."""
+        return [
+            Partition(*row) for row in conn.execute(
+                "SELECT ano, max_id, max_fim_iso, estado FROM apontamentos_particoes ORDER BY max_id DESC"
+            )
+        ]
+
+    def overlapping(self, conn: sqlite3.Connection, first_iso: str, last_iso: str) -> List[Partition]:
+        """
+        Partições que podem ter registros com período sobrepondo [first_iso, last_iso]:
+        começaram até o ano de `last_iso` e terminam (no máximo) depois de `first_iso`.
+        """
+        return [
+            Partition(*row) for row in conn.execute(
+                """
+                SELECT ano, max_id, max_fim_iso, estado FROM apontamentos_particoes
+                WHERE ano BETWEEN 1 AND ? AND max_fim_iso >= ?
+                ORDER BY max_id DESC
+                """,
+                (year_of(last_iso), first_iso),
+            )
+        ]
+
+    def locate(self, conn: sqlite3.Connection, ids: Iterable[int]) -> Dict[int, List[int]]:
+        """Agrupa ids por ano da partição (ids inexistentes são omitidos)."""
+        ids = list(ids)
+        grouped: Dict[int, List[int]] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for record_id, ano in conn.execute(
+                f"SELECT id, ano FROM apontamentos_ids WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ):
+                grouped.setdefault(ano, []).append(record_id)
+        return grouped
+
+    def describe(self, conn: sqlite3.Connection, ids: Iterable[int]) -> Dict[int, tuple]:
+        """(colaborador, periodo_inicio_iso, periodo_fim_iso) dos ids existentes (usado pelo cache)."""
+        result = {}
+        attached_before = set(self._attached(conn))
+        for ano, ano_ids in self.locate(conn, ids).items():
+            schema = self.attach(conn, ano)
+            for row in conn.execute(
+                f"""
+                SELECT id, colaborador, periodo_inicio_iso, periodo_fim_iso FROM {schema}.apontamentos
+                WHERE id IN ({','.join('?' * len(ano_ids))})
+                """,
+                ano_ids,
+            ):
+                result[row[0]] = tuple(row[1:])
+            if schema not in attached_before:
+                self.detach(conn, ano)
+        return result
+
+    # ---------- gravação ----------
+
+    def allocate(self, conn: sqlite3.Connection, ano: int) -> int:
+        """Reserva um id global para um registro da partição `ano` (dentro da transação de gravação)."""
+        return conn.execute("INSERT INTO apontamentos_ids (ano) VALUES (?)", (ano,)).lastrowid
+
+    def register_insert(self, conn: sqlite3.Connection, ano: int, record_id: int, fim_iso: Optional[str]):
+        """Atualiza o catálogo após uma inclusão; falha se a partição foi congelada nesse meio tempo."""
+        updated = conn.execute(
+            """
+            UPDATE apontamentos_particoes SET
+                max_id = MAX(max_id, ?),
+                max_fim_iso = CASE WHEN max_fim_iso IS NULL OR ? > max_fim_iso THEN ? ELSE max_fim_iso END
+            WHERE ano = ? AND estado = ?
+            """,
+            (record_id, fim_iso, fim_iso, ano, GRAVAVEL),
+        ).rowcount
+        if not updated:
+            raise PartitionFrozenError(ano)
+
+    @staticmethod
+    def register_names(conn: sqlite3.Connection, nomes: Iterable[str]):
+        """Registra os nomes de colaboradores gravados (na mesma transação da inclusão)."""
+        conn.executemany(
+            "INSERT OR IGNORE INTO main.apontamentos_colaboradores (nome) VALUES (LOWER(?))",
+            [(nome,) for nome in set(nomes)],
+        )
+
+    def check_writable(self, conn: sqlite3.Connection, ano: int):
+        row = conn.execute("SELECT estado FROM apontamentos_particoes WHERE ano = ?", (ano,)).fetchone()
+        if row is not None and row[0] != GRAVAVEL:
+            raise PartitionFrozenError(ano)
+
+    # ---------- congelamento ----------
+
+    def freeze(self, conn: sqlite3.Connection, ano: int, estado: int = IMUTAVEL):
+        """
+        Congela uma partição: a partir do commit do catálogo, gravações e exclusões são
+        recusadas; o arquivo é compactado, sai do modo WAL e fica somente leitura no disco.
+
+        A partição passa primeiro a somente leitura (mode=ro lê o WAL normalmente) e só vira
+        imutável depois de sair do WAL: immutable=1 ignoraria o que ainda estivesse no WAL.
+        Sair do WAL exige que nenhuma outra conexão esteja com o arquivo aberto; se não for
+        possível, a partição fica somente leitura e o erro é propagado (basta repetir).
+        """
+        if ano == SEM_DATA or estado not in (SOMENTE_LEITURA, IMUTAVEL):
+            raise ValueError("Partição ou estado inválido")
+        if conn.execute("SELECT 1 FROM apontamentos_particoes WHERE ano = ?", (ano,)).fetchone() is None:
+            raise ValueError(f"Não existe partição para {ano}")
+
+        # BEGIN IMMEDIATE espera as gravações em andamento (todas gravam no banco principal)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("UPDATE apontamentos_particoes SET estado = ? WHERE ano = ?", (SOMENTE_LEITURA, ano))
+        conn.execute("COMMIT")
+
+        path = self.partition_path(ano)
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        part = sqlite3.connect(str(path), isolation_level=None)
+        try:
+            part.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            mode = part.execute("PRAGMA journal_mode = DELETE").fetchone()[0]
+            if mode.lower() != "delete":
+                raise sqlite3.OperationalError(f"Partição {ano} continua em modo {mode}")
+            part.execute("VACUUM")
+        finally:
+            part.close()
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        if estado == IMUTAVEL:
+            conn.execute("UPDATE apontamentos_particoes SET estado = ? WHERE ano = ?", (IMUTAVEL, ano))
+            conn.commit()
+
+    def unfreeze(self, conn: sqlite3.Connection, ano: int):
+        """Volta a permitir gravações em uma partição congelada."""
+        path = self.partition_path(ano)
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+        part = sqlite3.connect(str(path), isolation_level=None)
+        try:
+            part.execute("PRAGMA journal_mode = WAL")
+        finally:
+            part.close()
+        conn.execute("UPDATE apontamentos_particoes SET estado = ? WHERE ano = ?", (GRAVAVEL, ano))
+        conn.commit()
@@ -0,0 +1,226 @@
+"""
+Serviço de integração com o Redmine.
+Cliente assíncrono (conexões keep-alive reutilizadas, concorrência limitada e
+paginação em lote) e conciliação dos lançamentos com o resultado da análise.
+"""
+
+import asyncio
+import math
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+# Limite máximo de itens por página aceito pela API REST do Redmine
+REDMINE_MAX_PAGE_SIZE = 100
+
+
+class RedmineError(Exception):
+    """Falha ao consultar o Redmine (rede, autenticação ou resposta inválida)."""
+
+
+class RedmineClient:
+    """
+    Cliente assíncrono da API REST do Redmine.
+
+    Args:
+        base_url: URL do Redmine (ex: https://redmine.empresa.com.br)
+        api_key: Chave de API (enviada no cabeçalho X-Redmine-API-Key)
+        max_connections: Conexões HTTP mantidas no pool (keep-alive)
+        max_concurrency: Requisições simultâneas ao Redmine
+        page_size: Itens por página (máximo 100)
+        timeout: Timeout por requisição em segundos
+    """
+
+    def __init__(self, base_url: str, api_key: str = "", max_connections: int = 10,
+                 max_concurrency: int = 4, page_size: int = REDMINE_MAX_PAGE_SIZE, timeout: float = 15.0):
+        self.page_size = min(page_size, REDMINE_MAX_PAGE_SIZE)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        headers = {"Accept": "application/json"}
+        if api_key:
+            headers["X-Redmine-API-Key"] = api_key
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=30.0,
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _get(self, path: str, params: Dict) -> Dict:
+        async with self._semaphore:
+            try:
+                response = await self._client.get(path, params=params)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPStatusError as e:
+                raise RedmineError(f"Redmine respondeu {e.response.status_code} em {path}") from e
+            except (httpx.HTTPError, ValueError) as e:
+                raise RedmineError(f"Erro ao consultar o Redmine: {e}") from e
+
+    async def fetch_time_entries(self, user_id: int, from_date: date, to_date: date) -> List[Dict]:
+        """
+        Busca todos os lançamentos de horas de um usuário no período.
+        A primeira página informa o total; as demais são buscadas em paralelo.
+        """
+        params = {
+            "user_id": user_id,
+            "from": from_date.isoformat(),
+            "to": to_date.isoformat(),
+            "limit": self.page_size,
+        }
+        first = await self._get("/time_entries.json", {**params, "offset": 0})
+        entries = list(first.get("time_entries", []))
+        total = int(first.get("total_count", len(entries)))
+
+        offsets = range(self.page_size, total, self.page_size)
+        pages = await asyncio.gather(*[
+            self._get("/time_entries.json", {**params, "offset": offset}) for offset in offsets
+        ])
+        for page in pages:
+            entries.extend(page.get("time_entries", []))
+        return entries
+
+    async def fetch_time_entries_batch(self, user_ids: Iterable[int], from_date: date,
+                                       to_date: date) -> Dict[int, List[Dict]]:
+        """Busca os lançamentos de vários usuários no mesmo período (respeitando a concorrência máxima)."""
+        user_ids = list(user_ids)
+        results = await asyncio.gather(*[
+            self.fetch_time_entries(user_id, from_date, to_date) for user_id in user_ids
+        ])
+        return dict(zip(user_ids, results))
+
+
+# ============ CONCILIAÇÃO ============
+
+def _day_iso(date_str: str) -> Optional[str]:
+    try:
+        return datetime.strptime(date_str, "%d/%m/%Y").date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _expected_hours(day: Dict) -> float:
+    if day.get("is_ignored"):
+        return 0.0
+    try:
+        return float(day.get("redmine_value", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _entry_hours(entry: Dict) -> float:
+    """Horas de um lançamento; RedmineError se o valor não for um número finito."""
+    hours = entry.get("hours")
+    if hours is None:
+        return 0.0
+    try:
+        value = float(hours)
+    except (TypeError, ValueError):
+        value = math.nan
+    if isinstance(hours, bool) or not math.isfinite(value):
+        raise RedmineError(f"Lançamento {entry.get('id')} com horas inválidas: {hours!r}")
+    return value
+
+
+def reconcile(days: List[Dict], entries: List[Dict], tolerance: float = 0.01) -> Dict:
+    """
+    Concilia os dias analisados (saída de process_day / /api/analyze) com os lançamentos
+    do Redmine, por merge das duas sequências ordenadas por data.
+
+    Situações:
+        confere: horas lançadas iguais ao valor Redmine calculado (dentro da tolerância)
+        divergente: ambos existem, mas com valores diferentes
+        nao_lancado: dia útil com horas e nada lançado no Redmine
+        lancado_em_dia_ignorado: horas lançadas em feriado/final de semana/exceção
+        sem_apontamento: lançamento em data que não está na análise
+
+    Returns:
+        dict com "itens" (um por data) e "resumo" (contagem por situação)
+
+    Raises:
+        ValueError: a mesma data aparece mais de uma vez nos dias analisados
+        RedmineError: lançamento com horas que não são um número
+    """
+    # Lançamentos agregados por dia (o Redmine pode ter várias entradas no mesmo dia)
+    logged: Dict[str, float] = defaultdict(float)
+    for entry in entries:
+        spent_on = entry.get("spent_on")
+        if spent_on:
+            logged[spent_on] += _entry_hours(entry)
+    logged_sorted = sorted(logged.items())
+
+    analyzed = sorted(
+        ((iso, day) for iso, day in ((_day_iso(d.get("date")), d) for d in days) if iso),
+        key=lambda item: item[0],
+    )
+    for previous, current in zip(analyzed, analyzed[1:]):
+        if previous[0] == current[0]:
+            raise ValueError(f"Data repetida nos dias analisados: {current[1].get('date')}")
+
+    items = []
+
+    def add(iso: str, day: Optional[Dict], hours_logged: float):
+        expected = _expected_hours(day) if day else 0.0
+        difference = round(hours_logged - expected, 2)
+        if day is None:
+            situacao = "sem_apontamento"
+        elif day.get("is_ignored"):
+            situacao = "lancado_em_dia_ignorado" if hours_logged > tolerance else "confere"
+        elif hours_logged <= tolerance and expected > tolerance:
+            situacao = "nao_lancado"
+        elif abs(difference) > tolerance:
+            situacao = "divergente"
+        else:
+            situacao = "confere"
+        items.append({
+            "date": datetime.strptime(iso, "%Y-%m-%d").strftime("%d/%m/%Y"),
+            "esperado": round(expected, 2),
+            "lancado": round(hours_logged, 2),
+            "diferenca": difference,
+            "situacao": situacao,
+        })
+
+    i = j = 0
+    while i < len(analyzed) or j < len(logged_sorted):
+        if j >= len(logged_sorted) or (i < len(analyzed) and analyzed[i][0] < logged_sorted[j][0]):
+            add(analyzed[i][0], analyzed[i][1], 0.0)
+            i += 1
+        elif i >= len(analyzed) or logged_sorted[j][0] < analyzed[i][0]:
+            add(logged_sorted[j][0], None, logged_sorted[j][1])
+            j += 1
+        else:
+            add(analyzed[i][0], analyzed[i][1], logged_sorted[j][1])
+            i += 1
+            j += 1
+
+    resumo = defaultdict(int)
+    for item in items:
+        resumo[item["situacao"]] += 1
+
+    return {
+        "itens": items,
+        "resumo": {
+            "total_dias": len(items),
+            "confere": resumo["confere"],
+            "divergente": resumo["divergente"],
+            "nao_lancado": resumo["nao_lancado"],
+            "lancado_em_dia_ignorado": resumo["lancado_em_dia_ignorado"],
+            "sem_apontamento": resumo["sem_apontamento"],
+            "total_esperado": round(sum(item["esperado"] for item in items), 2),
+            "total_lancado": round(sum(item["lancado"] for item in items), 2),
+        },
+    }
@@ -0,0 +1,60 @@
+"""
+Coalescência de computações idênticas em andamento ("single-flight").
+Enquanto uma computação para uma chave está rodando, chamadas com a mesma
+chave aguardam o mesmo resultado em vez de repetir o trabalho.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Compartilha uma única execução entre chamadas simultâneas com a mesma chave.
+
+    O resultado é compartilhado entre os chamadores: não deve ser modificado.
+    Não é um cache: terminada a execução, a próxima chamada computa de novo.
+
+    Args:
+        name: Nome usado nas métricas
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        """
+        Executa `await fn(*args)` uma vez por chave em andamento.
+        Para funções síncronas, passe `run_in_threadpool` como `fn` e a função nos args.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            # Task independente: se o primeiro chamador for cancelado (cliente desconectou),
+            # a computação continua para os demais
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marca a exceção como lida mesmo se todos os chamadores tiverem sido cancelados
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
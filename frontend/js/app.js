@@ -109,7 +109,10 @@ async function apiCall(endpoint, method = "GET", data = null) {
   if (!response.ok) {
     const errorBody = await response.json().catch(() => null);
     const detail = errorBody?.detail || errorBody?.message || `Erro HTTP ${response.status}`;
-    throw new Error(detail);
+    const error = new Error(detail);
+    error.status = response.status;
+    error.body = errorBody;
+    throw error;
   }
   return response;
 }
@@ -386,11 +389,10 @@ function showWeekendConfirmModal(dateStr, dayName) {
 }
 
 function showSaveConfirmModal() {
-  // Verificar duplicatas ANTES de mostrar o modal de confirmação
   checkDuplicateAndSave();
 }
 
-async function checkDuplicateAndSave() {
+function checkDuplicateAndSave() {
   // Garantir que o colaborador está sempre atualizado a partir do campo de input
   const colaborador = elements.colaboradorName.value.trim() || state.colaborador;
 
@@ -411,26 +413,9 @@ async function checkDuplicateAndSave() {
     return;
   }
 
-  showLoading(true);
-  try {
-    const params = new URLSearchParams({ colaborador, periodo_inicio: periodoInicio, periodo_fim: periodoFim });
-    const response = await apiCall(`/api/verificar-duplicata?${params}`);
-    const data = await response.json();
-    showLoading(false);
-
-    if (data.duplicata && data.registros.length > 0) {
-      // Mostrar modal de aviso de duplicata
-      showDuplicateWarningModal(colaborador, data.registros);
-    } else {
-      // Sem duplicata — mostrar modal de confirmação normal
-      showNormalSaveModal(colaborador, periodoInicio, periodoFim);
-    }
-  } catch (error) {
-    showLoading(false);
-    console.error("Erro ao verificar duplicata:", error);
-    // Em caso de erro na verificação, deixar salvar normalmente
-    showNormalSaveModal(colaborador, periodoInicio, periodoFim);
-  }
+  // A verificação de duplicata acontece no próprio salvamento (mesma transação);
+  // se houver conflito, o servidor responde 409 e o aviso é mostrado em saveToHistory
+  showNormalSaveModal(colaborador, periodoInicio, periodoFim);
 }
 
 function showDuplicateWarningModal(colaborador, conflitos) {
@@ -466,7 +451,7 @@ function showDuplicateWarningModal(colaborador, conflitos) {
   document.getElementById("dup-modal-confirm").addEventListener("click", () => {
     modal.style.display = "none";
     // Salvar mesmo com duplicata
-    saveToHistory();
+    saveToHistory(true);
   });
 }
 
@@ -1108,7 +1093,7 @@ window.setStatus = setStatus;
 
 // ============ Salvar no Histórico ============
 
-async function saveToHistory() {
+async function saveToHistory(ignorarDuplicata = false) {
   // Sempre reler o colaborador do campo de input para garantir valor atual
   const colaborador = elements.colaboradorName.value.trim() || state.colaborador;
   if (!colaborador) { showToast("Informe seu nome antes de salvar", "error"); elements.colaboradorName.focus(); return; }
@@ -1142,12 +1127,13 @@ async function saveToHistory() {
 
   showLoading(true);
   try {
-    await apiCall("/api/salvar-apontamento", "POST", {
+    await apiCall("/api/salvar-apontamento-verificado", "POST", {
       colaborador,
       periodo_inicio: periodoInicio,
       periodo_fim: periodoFim,
       total_horas: totalHoras,
       dias,
+      ignorar_duplicata: ignorarDuplicata,
     });
 
     showToast("✅ Apontamento salvo no histórico!", "success");
@@ -1163,6 +1149,11 @@ async function saveToHistory() {
     elements.historySection.style.display = "block";
     elements.historySection.scrollIntoView({ behavior: "smooth" });
   } catch (error) {
+    if (error.status === 409 && error.body?.registros) {
+      // Já existe apontamento sobreposto: nada foi gravado, perguntar antes de salvar
+      showDuplicateWarningModal(colaborador, error.body.registros);
+      return;
+    }
     console.error("Erro ao salvar:", error);
     showToast(`Erro ao salvar: ${error.message}`, "error");
   } finally {
@@ -1172,26 +1163,68 @@ async function saveToHistory() {
 
 // ============ Histórico ============
 
+// Cache local da lista do histórico: após a primeira carga, só as alterações
+// (novos registros e exclusões) são buscadas via /api/historico?since=<cursor>
+const historyCache = {
+  key: null,     // filtros usados na última carga
+  cursor: null,  // cursor retornado pela API
+  records: [],   // registros exibidos (ordem decrescente de id)
+};
+
+const HISTORY_MAX_RECORDS = 100;
+
+function applyHistoryDelta(records, data) {
+  const removed = new Set(data.removidos || []);
+  const incoming = data.registros || [];
+  const incomingIds = new Set(incoming.map((rec) => rec.id));
+  return incoming
+    .concat(records.filter((rec) => !removed.has(rec.id) && !incomingIds.has(rec.id)))
+    .sort((a, b) => b.id - a.id)
+    .slice(0, HISTORY_MAX_RECORDS);
+}
+
 async function loadHistory() {
   const colaborador = elements.filterColaborador?.value?.trim() || "";
   const mes = elements.filterMes?.value || "";
+  const cacheKey = `${colaborador}|${mes}`;
 
   let endpoint = "/api/historico";
   const params = [];
   if (colaborador) params.push(`colaborador=${encodeURIComponent(colaborador)}`);
   if (mes) params.push(`mes=${encodeURIComponent(mes)}`);
+  if (historyCache.key === cacheKey && historyCache.cursor !== null) {
+    params.push(`since=${historyCache.cursor}`);
+  }
   if (params.length > 0) endpoint += "?" + params.join("&");
 
   try {
     const response = await apiCall(endpoint);
     const data = await response.json();
-    renderHistoryCards(data.registros || []);
+
+    if (data.delta) {
+      const merged = applyHistoryDelta(historyCache.records, data);
+      if (merged.length < HISTORY_MAX_RECORDS && historyCache.records.length >= HISTORY_MAX_RECORDS) {
+        // Exclusões deixaram a página cheia abaixo do limite: o servidor pode ter registros
+        // mais antigos para completá-la, então recarrega a lista completa
+        historyCache.cursor = null;
+        return loadHistory();
+      }
+      historyCache.records = merged;
+    } else {
+      historyCache.records = data.registros || [];
+    }
+    historyCache.key = cacheKey;
+    historyCache.cursor = data.cursor ?? null;
+
+    renderHistoryCards(historyCache.records);
     elements.historySection.style.display = "block";
     // Ocultar botão flutuante quando o histórico está visível
     const floatBtn = document.getElementById("float-history-btn");
     if (floatBtn) floatBtn.style.display = "none";
   } catch (error) {
     console.error("Erro ao carregar histórico:", error);
+    historyCache.key = null;
+    historyCache.cursor = null;
     if (elements.historyList) {
       elements.historyList.innerHTML = `<p class="history-empty">Erro ao carregar o histórico. Tente novamente.</p>`;
     }
@@ -1239,6 +1272,11 @@ function renderHistoryCards(records) {
               onclick="viewHistoryDetail(${rec.id})"
               title="Ver detalhes das atividades"
             >👁️</button>
+            <button
+              class="btn-export-history"
+              onclick="exportHistoryRecord(${rec.id})"
+              title="Exportar este registro para Excel"
+            >📥</button>
             <button
               class="btn-delete-history"
               onclick="deleteHistoryRecord(${rec.id})"
@@ -1266,6 +1304,23 @@ async function deleteHistoryRecord(id) {
 
 window.deleteHistoryRecord = deleteHistoryRecord;
 
+// Registro salvo: o servidor gera a planilha uma vez e serve as próximas do cache em disco
+async function exportHistoryRecord(id) {
+  showLoading(true);
+  try {
+    const response = await apiCall(`/api/historico/${id}/export?formato=xlsx`);
+    downloadBlob(await response.blob(), `apontamento_${id}.xlsx`);
+    showToast("Arquivo exportado com sucesso!", "success");
+  } catch (error) {
+    console.error("Erro ao exportar:", error);
+    showToast(`Erro ao exportar: ${error.message}`, "error");
+  } finally {
+    showLoading(false);
+  }
+}
+
+window.exportHistoryRecord = exportHistoryRecord;
+
 // ============ Detalhe do Histórico ============
 
 async function viewHistoryDetail(id) {
@@ -1375,6 +1430,17 @@ window.viewHistoryDetail = viewHistoryDetail;
 
 // ============ Export ============
 
+function downloadBlob(blob, filename) {
+  const url = window.URL.createObjectURL(blob);
+  const a = document.createElement("a");
+  a.href = url;
+  a.download = filename;
+  document.body.appendChild(a);
+  a.click();
+  document.body.removeChild(a);
+  window.URL.revokeObjectURL(url);
+}
+
 async function handleExport() {
   if (!state.results || !state.results.days.length) { showToast("Nenhum dado para exportar", "error"); return; }
   showLoading(true);
@@ -1385,15 +1451,7 @@ async function handleExport() {
       body: JSON.stringify({ days: state.results.days }),
     });
     if (!response.ok) throw new Error("Erro ao exportar");
-    const blob = await response.blob();
-    const url = window.URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.href = url;
-    a.download = "apontamento_resultado.xlsx";
-    document.body.appendChild(a);
-    a.click();
-    document.body.removeChild(a);
-    window.URL.revokeObjectURL(url);
+    downloadBlob(await response.blob(), "apontamento_resultado.xlsx");
     showToast("Arquivo exportado com sucesso!", "success");
   } catch (error) {
     console.error("Erro:", error);